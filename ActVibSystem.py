@@ -1,46 +1,311 @@
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+import pyarrow.parquet as pq
 from numpy import linspace
 
+
+def newcolumnname(cname):
+    """
+        New name of a column with legacy (Portuguese) name, e.g. "Tempo (s)" -> "time", "ADC 1.1" -> "adc1.1".
+        Other names are kept.
+    """
+    if cname.startswith("Tempo"):
+        return "time"
+    elif cname.startswith("IMU") or (cname == "Log"):
+        return cname.lower()
+    elif cname.startswith("DAC") or cname.startswith("ADC"):
+        return cname.replace(" ","").lower()
+    elif cname == "Perturbacao":
+        return "perturb"
+    elif cname == "Controle":
+        return "ctrl"
+    elif cname == "Referencia":
+        return "ref"
+    elif cname == "Erro":
+        return "err"
+    return cname
+
+
+def newcolumnnames(cnames):
+    """
+        Column names with the legacy names renamed (see newcolumnname()), if the file uses them ("Tempo (s)" column).
+    """
+    if "Tempo (s)" in cnames:
+        return [newcolumnname(cname) for cname in cnames]
+    return list(cnames)
+
+
 class ActVibData(pd.DataFrame):
 
-    def __init__(self,filename):    
+    """
+        Measurements of the ActVib system.
+
+        CSV and Feather V1 files are read at once. Feather (Arrow IPC, memory-mapped) and parquet files are loaded
+        column by column; numeric feather columns are zero-copy views of the memory-mapped file. All the columns are
+        loaded when the file is opened, unless columns are given (only those are loaded) or lazy is True
+        (none is loaded). Columns not loaded yet are loaded on their first access (by getSignal(), getAccX(),
+        data["name"], data.name, etc.), so that only the signals in use are read; until then, they are not in
+        columns and are ignored by DataFrame methods (head(), describe(), etc.). Use load() to load columns
+        in advance.
+    """
+    _metadata = ["filename","hasLog","source","sourcefile","sourcecolumns","signalnames","adccolumns","adcdata","adctime"]
+
+    def __init__(self,filename,columns=None,lazy=False):
+        self.source = None
+        self.sourcefile = None
+        self.sourcecolumns = {}
+        frame = None
         if str(filename).endswith(".csv"):
-            super().__init__(pd.read_csv(filename,index_col=0,sep="\t"))
-        else:    
-            super().__init__(pd.read_feather(filename))
-        self.filename = filename        
-        if "Tempo (s)" in self.columns:
-            self.oldcnamestonew()
-        if "log" in self.columns:
-            self.hasLog = True
+            frame = pd.read_csv(filename,index_col=0,sep="\t")
+        elif str(filename).endswith(".parquet"):
+            self.source = pq.ParquetFile(filename)
+            schema = self.source.schema_arrow
+            nrows = self.source.metadata.num_rows
         else:
-            self.hasLog = False
-        
+            self.sourcefile = pa.memory_map(str(filename),"r")
+            try:
+                self.source = pa.ipc.open_file(self.sourcefile)
+            except pa.ArrowInvalid:
+                # Feather V1 files are not Arrow IPC files: read at once, as CSV files.
+                self.sourcefile.close()
+                self.sourcefile = None
+                frame = feather.read_table(str(filename)).to_pandas()
+            else:
+                schema = self.source.schema
+                nrows = sum(self.source.get_batch(k).num_rows for k in range(self.source.num_record_batches))
+        if frame is not None:
+            super().__init__(frame)
+            if "Tempo (s)" in self.columns:
+                self.oldcnamestonew()
+            self.signalnames = list(self.columns)
+        else:
+            sourcenames = [cname for cname in schema.names if not cname.startswith("__index_level_")]
+            self.signalnames = newcolumnnames(sourcenames)
+            self.sourcecolumns = dict(zip(self.signalnames,sourcenames))
+            super().__init__(index=pd.RangeIndex(nrows))
+        self.filename = filename
+        self.hasLog = "log" in self.signalnames
+        self.adccolumns = [cname for cname in self.signalnames if cname.startswith("adc")]
+        self.adcdata = None
+        self.adctime = None
+        if columns is not None:
+            self.load(columns)
+        elif not lazy:
+            self.load()
+
+    def close(self):
+        """
+            Closes the file (feather memory map or parquet file). Columns already loaded remain available (the
+            memory-mapped region is kept while they reference it), but other columns can no longer be read.
+        """
+        if isinstance(self.source,pq.ParquetFile):
+            self.source.close()
+        elif self.sourcefile is not None:
+            self.sourcefile.close()
+
     def oldcnamestonew(self):
-        cnames = self.columns
-        newcnames = []
-        for k in range(len(cnames)):
-            if cnames[k].startswith("Tempo"):
-                newcnames.append("time")
-            elif cnames[k].startswith("IMU") or (cnames[k] == "Log"):
-                newcnames.append(cnames[k].lower())
-            elif cnames[k].startswith("DAC") or cnames[k].startswith("ADC"):
-                newcnames.append(cnames[k].replace(" ","").lower())
-            elif cnames[k] == "Perturbacao":
-                newcnames.append("perturb")
-            elif cnames[k] == "Controle":
-                newcnames.append("ctrl")
-            elif cnames[k] == "Referencia":
-                newcnames.append("ref")
-            elif cnames[k] == "Erro": 
-                 newcnames.append("err")
-        self.columns = newcnames 
+        self.columns = newcolumnnames(list(self.columns))
+
+    def readcolumn(self,sourcename,rowgroups=None):
+        # Reads a column from the file (only the given row groups of parquet files), as a zero-copy numpy view when possible.
+        if isinstance(self.source,pq.ParquetFile):
+            if rowgroups is None:
+                values = self.source.read(columns=[sourcename]).column(0)
+            else:
+                values = self.source.read_row_groups(rowgroups,columns=[sourcename]).column(0)
+        else:
+            idx = self.source.schema.get_field_index(sourcename)
+            values = pa.chunked_array([self.source.get_batch(k).column(idx) for k in range(self.source.num_record_batches)],
+                                      type=self.source.schema.field(idx).type)
+        return self.tonumpy(values)
+
+    @staticmethod
+    def tonumpy(values):
+        # Numpy array of an Arrow Array or ChunkedArray (zero-copy for float arrays in one chunk without nulls).
+        if isinstance(values,pa.ChunkedArray) and (values.num_chunks == 1):
+            values = values.chunk(0)
+        if isinstance(values,pa.Array) and (values.null_count == 0) and pa.types.is_floating(values.type):
+            return values.to_numpy(zero_copy_only=True)
+        return values.to_pandas().values
+
+    def _column(self,name):
+        """
+            Column name, loaded from the file if not loaded yet.
+        """
+        if (name not in self.columns) and (name in self.sourcecolumns):
+            values = self.readcolumn(self.sourcecolumns[name])
+            self[name] = pd.Series(values,index=self.index,copy=False)
+        return super().__getitem__(name)
+
+    def load(self,columns=None):
+        """
+            Loads the given columns (all when None) from the file and returns self.
+        """
+        for name in (self.signalnames if columns is None else columns):
+            self._column(name)
+        return self
+
+    def __getattr__(self,name):
+        # Attribute access (e.g. data.time) to columns not loaded yet.
+        sourcecolumns = self.__dict__.get("sourcecolumns")
+        if sourcecolumns and (name in sourcecolumns) and not name.startswith("_"):
+            return self._column(name)
+        return super().__getattr__(name)
+
+    def __getitem__(self,key):
+        if self.source is not None:
+            if isinstance(key,str):
+                if key in self.sourcecolumns:
+                    return self._column(key)
+            elif isinstance(key,list):
+                for name in key:
+                    if isinstance(name,str) and (name in self.sourcecolumns):
+                        self._column(name)
+        return super().__getitem__(key)
+
+    def rowgroupranges(self):
+        # First row, number of rows and (min,max) statistics of "time" of each row group of a parquet file.
+        meta = self.source.metadata
+        tidx = self.source.schema_arrow.get_field_index(self.sourcecolumns["time"])
+        groups = []
+        firstrow = 0
+        for k in range(meta.num_row_groups):
+            rg = meta.row_group(k)
+            stats = rg.column(tidx).statistics
+            minmax = (stats.min,stats.max) if (stats is not None) and stats.has_min_max else None
+            groups.append((firstrow,rg.num_rows,minmax))
+            firstrow += rg.num_rows
+        return groups
+
+    def rowrange(self,t0,t1):
+        """
+            Rows (r0,r1) with t0 <= time <= t1 (r1 exclusive), by binary search on the monotonic time column.
+            For parquet files whose time column is not loaded, only the row groups that may contain the window
+            (according to their statistics) are read.
+        """
+        if isinstance(self.source,pq.ParquetFile) and ("time" not in self.columns):
+            groups = self.rowgroupranges()
+            selected = [k for k,(_,_,minmax) in enumerate(groups)
+                        if (minmax is None) or ((minmax[1] >= t0) and (minmax[0] <= t1))]
+            if len(selected) == 0:
+                return 0,0
+            selected = list(range(selected[0],selected[-1]+1))
+            time = self.readcolumn(self.sourcecolumns["time"],selected)
+            offset = groups[selected[0]][0]
+        else:
+            time = self._column("time").values
+            offset = 0
+        r0 = np.searchsorted(time,t0,side="left")
+        r1 = np.searchsorted(time,t1,side="right")
+        return offset + int(r0),offset + int(max(r1,r0))
+
+    def readrows(self,name,r0,r1):
+        # Rows r0 to r1-1 of column name, reading only the needed part of the file when not loaded.
+        if (name in self.columns) or (name not in self.sourcecolumns):
+            return self._column(name).values[r0:r1]
+        if isinstance(self.source,pq.ParquetFile):
+            groups = self.rowgroupranges()
+            selected = [k for k,(first,n,_) in enumerate(groups) if (first < r1) and (first + n > r0)]
+            if len(selected) == 0:
+                return self.readcolumn(self.sourcecolumns[name],[0])[0:0]
+            values = self.readcolumn(self.sourcecolumns[name],selected)
+            offset = groups[selected[0]][0]
+            return values[r0-offset:r1-offset]
+        # Feather: slices of the memory-mapped record batches.
+        idx = self.source.schema.get_field_index(self.sourcecolumns[name])
+        chunks = [self.source.get_batch(k).column(idx) for k in range(self.source.num_record_batches)]
+        values = pa.chunked_array(chunks,type=self.source.schema.field(idx).type).slice(r0,r1-r0)
+        return self.tonumpy(values.combine_chunks() if values.num_chunks > 1 else values)
+
+    def window(self,t0,t1,columns=None,asarrays=False):
+        """
+            Samples with t0 <= time <= t1 (e.g. around the events in getLogs()) of the given columns (all when None),
+            reading only the corresponding rows (and parquet row groups) of the file for columns not loaded yet;
+            columns other than time (which is loaded for feather files, as a zero-copy view, to be searched) are not
+            loaded into this DataFrame.
+            Returns a DataFrame indexed by the row numbers or, if asarrays, a dictionary of arrays.
+        """
+        r0,r1 = self.rowrange(t0,t1)
+        if columns is None:
+            columns = self.signalnames
+        data = {name: self.readrows(name,r0,r1) for name in columns}
+        if asarrays:
+            return data
+        return pd.DataFrame(data,index=pd.RangeIndex(r0,r1),copy=False)
+
+    def recordbatches(self,sourcenames,rows=None):
+        # Arrow tables with the given source columns, one parquet row group or feather record batch at a time
+        # (or rows rows at a time, regrouping consecutive ones), without reading the rest of the file.
+        if isinstance(self.source,pq.ParquetFile):
+            if rows is None:
+                batches = (self.source.read_row_group(k,columns=sourcenames) for k in range(self.source.num_row_groups))
+            else:
+                batches = (pa.Table.from_batches([b]) for b in self.source.iter_batches(batch_size=rows,columns=sourcenames))
+        else:
+            batches = (pa.Table.from_batches([self.source.get_batch(k).select(sourcenames)])
+                       for k in range(self.source.num_record_batches))
+        if rows is None:
+            yield from batches
+            return
+        pending = None
+        for table in batches:
+            pending = table if pending is None else pa.concat_tables([pending,table])
+            while pending.num_rows >= rows:
+                yield pending.slice(0,rows)
+                pending = pending.slice(rows)
+        if (pending is not None) and (pending.num_rows > 0):
+            yield pending
+
+    def iter_chunks(self,rows=None,columns=None):
+        """
+            Iterates over the file in blocks of rows rows (parquet row groups or feather record batches when None),
+            reading one block at a time so that memory use does not depend on the file size. Yields
+            (starttime,block): the time of the first row of the block and the samples of columns (a name, giving
+            1-D blocks, or a list of names, giving rows x columns blocks; all signals but time and log when None).
+            The columns are not loaded into this DataFrame. Blocks can be passed to stateful filters, e.g.:
+                dc = DCRemover()
+                acc = SpectrumAccumulator(fs=250,nperseg=4096)
+                for t0,block in data.iter_chunks(columns="imu1accx"):
+                    acc.process(dc.process(block))
+                magdb,freqs = acc.result()
+        """
+        single = isinstance(columns,str)
+        if columns is None:
+            columns = [name for name in self.signalnames if name not in ("time","log")]
+        elif single:
+            columns = [columns]
+        if self.source is None:
+            # CSV files are already in memory.
+            nrows = self.shape[0]
+            step = nrows if rows is None else rows
+            time = self["time"].values
+            values = [self[name].values for name in columns]
+            for r0 in range(0,nrows,max(step,1)):
+                block = values[0][r0:r0+step] if single else np.column_stack([v[r0:r0+step] for v in values])
+                yield time[r0],block
+            return
+        sourcenames = [self.sourcecolumns[name] for name in columns]
+        timename = self.sourcecolumns["time"]
+        readnames = sourcenames + ([timename] if timename not in sourcenames else [])
+        for table in self.recordbatches(readnames,rows):
+            if table.num_rows == 0:
+                continue
+            starttime = table.column(timename)[0].as_py()
+            values = [self.tonumpy(table.column(name)) for name in sourcenames]
+            yield starttime,(values[0] if single else np.column_stack(values))
 
     def getTime(self):
-        return self.time.values
+        return self["time"].values
 
     def getSignalNames(self):
-        return list(self.columns)
+        return list(self.signalnames)
 
     def getSignal(self,signalname):
         """
@@ -70,29 +335,48 @@ class ActVibData(pd.DataFrame):
     def getADCData(self,adcid=1):
         if (adcid < 1) or (adcid > 4):
             raise BaseException("ADCid must be between 1 and 4.")
-        adccols = list(filter(lambda x: x.startswith("adc"), self.getSignalNames()))
-        if len(adccols) == 0:
+        if len(self.adccolumns) == 0:
             raise BaseException("ADC data not found.")
-        return self[adccols[adcid-1]].values
-    
+        return self[self.adccolumns[adcid-1]].values
+
+    def adcblock(self):
+        """
+            ADC columns as a contiguous (read-only) rows x columns array, built once: each row holds consecutive
+            samples of the 1 kHz ADC stream, so the stream is a view of it. ADC columns of this DataFrame not
+            loaded yet are loaded as views of the same array.
+        """
+        if self.adcdata is None:
+            if len(self.adccolumns) == 0:
+                raise BaseException("ADC data not found.")
+            loaded = [name for name in self.adccolumns if name in self.columns]
+            dtype = np.result_type(*[self[name].dtype for name in loaded],np.float64)
+            block = np.empty((self.shape[0],len(self.adccolumns)),dtype=dtype)
+            for k,name in enumerate(self.adccolumns):
+                if name in loaded:
+                    block[:,k] = self[name].values
+                else:
+                    block[:,k] = self.readcolumn(self.sourcecolumns[name])
+            block.flags.writeable = False
+            for k,name in enumerate(self.adccolumns):
+                if name not in loaded:
+                    self[name] = pd.Series(block[:,k],index=self.index,copy=False)
+            self.adcdata = block
+        return self.adcdata
+
     def getadc1k(self):
-        adccols = list(filter(lambda x: x.startswith("adc"), self.getSignalNames()))
-        if len(adccols) == 0:
-            raise BaseException("ADC data not found.")
-        dt = self[adccols].values.reshape((self.shape[0]*4))
-        timevec = linspace(0,self["time"].values[-1]+3e-3,num=dt.shape[0])
-        return timevec,dt
+        dt = self.getADC1kHzData()
+        if self.adctime is None:
+            self.adctime = linspace(0,self["time"].values[-1]+3e-3,num=dt.shape[0])
+            self.adctime.flags.writeable = False
+        return self.adctime,dt
 
     def getADC1kHzData(self):
-        adccols = list(filter(lambda x: x.startswith("adc"), self.getSignalNames()))
-        if len(adccols) == 0:
-            raise BaseException("ADC data not found.")
-        return self[adccols].values.reshape((self.shape[0]*4))
+        return self.adcblock().reshape(-1)
 
     def getNotes(self):
         if not self.hasLog:
             raise BaseException(f"Notes and logs not found in {self.filename}.")
-        notes = self["log"].head(1).values.tolist()[0]
+        notes = self.readrows("log",0,1)[0]
         if notes == "Started":
             raise BaseException(f"Notes not found in {self.filename}.")
         return notes
@@ -103,4 +387,168 @@ class ActVibData(pd.DataFrame):
         logs = self[["time","log"]][self["log"].notnull()].values.tolist()
         if logs[0][1] != "Started":
             logs = logs[1:]
-        return logs        
\ No newline at end of file
+        return logs
+
+
+class MeasurementCatalog:
+
+    """
+        Catalog of the ActVibData files (.feather, .parquet and .csv) of a directory.
+
+        Scanning reads only the schema, number of rows and notes (see ActVibData.getNotes()) of each file into
+        index, a DataFrame with one row per file (indexed by file name). load() reads the requested signals from
+        many files concurrently with a thread pool (Arrow releases the GIL while reading and decoding) and keeps
+        up to maxsize decoded columns in an LRU, so that repeated requests do not read the files again. Files are
+        closed after scanning and opened again when read, keeping up to maxfiles of them open (also in an LRU).
+
+            catalog = MeasurementCatalog("Campaign1")
+            files = catalog.select(signals=["imu1accx"],notes="12 Hz")
+            accx = catalog.load("imu1accx",files,stack=True)   # files x samples
+    """
+    extensions = (".feather",".parquet",".csv")
+
+    def __init__(self,directory,recursive=False,maxworkers=None,maxsize=256,maxfiles=32):
+        self.directory = directory
+        self.recursive = recursive
+        self.maxworkers = maxworkers
+        self.maxsize = maxsize
+        self.maxfiles = maxfiles
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.files = OrderedDict()
+        self.resetstats()
+        self.scan()
+
+    def resetstats(self):
+        self.hits = 0
+        self.misses = 0
+
+    def getstats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self.entries)}
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def filenames(self):
+        # Measurement files of the directory (and its subdirectories if recursive), sorted by name.
+        if self.recursive:
+            names = [os.path.join(root,fname) for root,_,fnames in os.walk(self.directory) for fname in fnames]
+        else:
+            names = [os.path.join(self.directory,fname) for fname in os.listdir(self.directory)]
+        return sorted(name for name in names if name.endswith(self.extensions) and os.path.isfile(name))
+
+    def scanfile(self,filename):
+        # Index row of a file: format, number of rows (None for CSV files), signal names and notes (missing if not available).
+        if filename.endswith(".csv"):
+            # Only the header and the first rows (the notes are in the first row of the log column).
+            head = pd.read_csv(filename,index_col=0,sep="\t",nrows=1)
+            signalnames = newcolumnnames(list(head.columns))
+            nrows = None  # Not known without reading the whole file
+            notes = head.iloc[0,signalnames.index("log")] if ("log" in signalnames) and (head.shape[0] > 0) else None
+        else:
+            data = ActVibData(filename,lazy=True)
+            try:
+                signalnames = data.getSignalNames()
+                nrows = data.shape[0]
+                notes = data.readrows("log",0,1)[0] if data.hasLog and (nrows > 0) else None
+            finally:
+                data.close()
+        if (notes == "Started") or pd.isna(notes):
+            notes = None
+        return {"format": os.path.splitext(filename)[1][1:], "nrows": nrows, "signals": signalnames, "notes": notes}
+
+    def scan(self):
+        """
+            (Re)reads the schema and notes of the files of the directory into index.
+        """
+        filenames = self.filenames()
+        with self.lock:
+            self.files.clear()
+        self.clear()
+        with ThreadPoolExecutor(max_workers=self.maxworkers) as pool:
+            rows = list(pool.map(self.scanfile,filenames))
+        self.index = pd.DataFrame(rows,index=pd.Index(filenames,name="filename"),
+                                  columns=["format","nrows","signals","notes"])
+        return self.index
+
+    def select(self,signals=None,notes=None):
+        """
+            Files with all the given signals and whose notes contain the given text.
+        """
+        mask = np.ones(self.index.shape[0],dtype=bool)
+        if signals is not None:
+            signals = [signals] if isinstance(signals,str) else signals
+            mask &= np.array([all(name in names for name in signals) for names in self.index["signals"]],dtype=bool)
+        if notes is not None:
+            mask &= np.array([pd.notna(n) and (notes in n) for n in self.index["notes"]],dtype=bool)
+        return list(self.index.index[mask])
+
+    def open(self,filename):
+        """
+            ActVibData of a file of the catalog (opened lazily, only the used columns are read), from the LRU of
+            open files. Files evicted from the LRU are closed when no longer referenced (e.g. by a thread still
+            reading them).
+        """
+        with self.lock:
+            if filename in self.files:
+                self.files.move_to_end(filename)
+                return self.files[filename]
+        data = ActVibData(filename,lazy=True)
+        with self.lock:
+            data = self.files.setdefault(filename,data)
+            self.files.move_to_end(filename)
+            while len(self.files) > max(self.maxfiles,1):
+                self.files.popitem(last=False)
+        return data
+
+    def getcolumn(self,filename,name):
+        """
+            Samples of signal name of a file, from the LRU of decoded columns or read from the file.
+        """
+        key = (filename,name)
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return self.entries[key]
+            self.misses += 1
+        data = self.open(filename)
+        if name not in data.signalnames:
+            raise Exception(f"Signal {name} not found in {filename}.")
+        if (name in data.columns) or (data.source is None):
+            values = data.getSignal(name)
+        else:
+            values = data.readcolumn(data.sourcecolumns[name])
+        if self.maxsize > 0:
+            with self.lock:
+                self.entries[key] = values
+                self.entries.move_to_end(key)
+                while len(self.entries) > self.maxsize:
+                    self.entries.popitem(last=False)
+        return values
+
+    def getsignals(self,filename,signals):
+        if isinstance(signals,str):
+            return self.getcolumn(filename,signals)
+        return {name: self.getcolumn(filename,name) for name in signals}
+
+    def load(self,signals,filenames=None,stack=False):
+        """
+            Reads signals (a name or a list of names) of the given files (all the files of the catalog when
+            None) concurrently.
+            Returns a dictionary keyed by file name with the arrays (or dictionaries of arrays, for a list of
+            names) or, if stack, an array with the files along the first axis (files x samples, or
+            files x samples x signals for a list of names), provided that all the files have the same length.
+        """
+        if filenames is None:
+            filenames = list(self.index.index)
+        with ThreadPoolExecutor(max_workers=self.maxworkers) as pool:
+            results = list(pool.map(lambda filename: self.getsignals(filename,signals),filenames))
+        if not stack:
+            return dict(zip(filenames,results))
+        if not isinstance(signals,str):
+            results = [np.column_stack([values[name] for name in signals]) for values in results]
+        if len(set(values.shape[0] for values in results)) > 1:
+            raise Exception("Signals of files with different lengths cannot be stacked.")
+        return np.stack(results)
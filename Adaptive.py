@@ -1,4 +1,7 @@
 import numpy as np
+from scipy import signal, linalg, fft
+
+from .Filters import DelayLine
 
 
 class FIRNLMS:    
@@ -16,37 +19,98 @@ class FIRNLMS:
         self.wwavgwindow = wwavgwindow
         self.wwavg = None
 
-    def run(self,insignal,outsignal,maxiter=None):
+    def run(self,insignal,outsignal,maxiter=None,method='nlms',blocksize=None):
+        """
+            Identifies the FIR filter that maps insignal into outsignal. Results in ww, sqerror and wwavg.
+            method:
+                'nlms': sample-by-sample NLMS (default).
+                'blocknlms': block NLMS with FFT-based filtering and correlation (blocks of blocksize
+                             samples, memorysize by default). The gradient of each block is normalized by the
+                             mean regressor energy of the block and, for blocks longer than memorysize, scaled
+                             by memorysize/blocksize, so that the step does not grow with blocksize.
+                'wiener': direct least-squares (Wiener) solution using the Toeplitz structure of the input
+                          autocorrelation; regularization is added to the zero-lag autocorrelation.
+        """
         if not maxiter:
             rangesim = insignal.shape[0]
         else: 
             rangesim = min(insignal.shape[0],maxiter)
         if insignal.shape[0] != outsignal.shape[0]:
             raise Exception("Input and output must be vectors with same length.")
-        self.xx = np.zeros(self.N)
+        if method == 'nlms':
+            self.runnlms(insignal,outsignal,rangesim)
+        elif method == 'blocknlms':
+            self.runblocknlms(insignal,outsignal,rangesim,blocksize if blocksize else self.N)
+        elif method == 'wiener':
+            self.runwiener(insignal,outsignal,rangesim)
+        else:
+            raise Exception(f"Unknown method: {method}. Options are 'nlms', 'blocknlms' or 'wiener'.")
+        self.finished = True
+
+    def runnlms(self,insignal,outsignal,rangesim):
+        xxline = DelayLine(self.N,trackenergy=True)
+        self.xx = xxline.x
         self.ww = np.zeros(self.N)
+        dw = np.zeros(self.N)
         self.sqerror = np.zeros(rangesim)
         if self.wwavgwindow:
             self.wwavg = np.zeros(self.N)
             for n in range(rangesim):
-                self.xx[1:] = self.xx[0:-1]
-                self.xx[0] = insignal[n]
+                self.xx = xxline.push(insignal[n])
                 y = self.xx @ self.ww
                 e = outsignal[n] - y
-                self.ww = self.ww + self.mu * e * self.xx / (self.xx @ self.xx + self.psi)
+                np.multiply(self.xx,self.mu * e / (xxline.energy + self.psi),out=dw)
+                self.ww += dw
                 self.sqerror[n] = e**2
                 if n >= (rangesim-self.wwavgwindow):
                   self.wwavg += self.ww
             self.wwavg = self.wwavg / self.wwavgwindow
         else:
             for n in range(rangesim):
-                self.xx[1:] = self.xx[0:-1]
-                self.xx[0] = insignal[n]
+                self.xx = xxline.push(insignal[n])
                 y = self.xx @ self.ww
                 e = outsignal[n] - y
-                self.ww = self.ww + self.mu * e * self.xx / (self.xx @ self.xx + self.psi)
+                np.multiply(self.xx,self.mu * e / (xxline.energy + self.psi),out=dw)
+                self.ww += dw
                 self.sqerror[n] = e**2
-        self.finished = True
+
+    def runblocknlms(self,insignal,outsignal,rangesim,blocksize):
+        N = self.N
+        # Input with N-1 leading zeros, so that the regressor of sample n is xpad[n:n+N] (reversed).
+        xpad = np.concatenate((np.zeros(N-1),insignal[0:rangesim]))
+        self.ww = np.zeros(N)
+        self.sqerror = np.zeros(rangesim)
+        if self.wwavgwindow:
+            self.wwavg = np.zeros(N)
+            avgstart = rangesim - self.wwavgwindow
+        for n0 in range(0,rangesim,blocksize):
+            L = min(blocksize,rangesim-n0)
+            xs = xpad[n0:n0+L+N-1]
+            e = outsignal[n0:n0+L] - signal.fftconvolve(xs,self.ww,mode='valid')
+            self.sqerror[n0:n0+L] = e**2
+            # Mean regressor energy over the block, from the cumulative sum of squared inputs.
+            cumenergy = np.concatenate(([0],np.cumsum(xs**2)))
+            power = np.mean(cumenergy[N:] - cumenergy[:-N])
+            grad = signal.fftconvolve(xs,e[::-1],mode='valid')[::-1] * min(1.0,N/L)
+            self.ww += self.mu * grad / (power + self.psi)
+            if self.wwavgwindow and (n0+L > avgstart):
+                self.wwavg += self.ww * (n0 + L - max(n0,avgstart))
+        if self.wwavgwindow:
+            self.wwavg = self.wwavg / self.wwavgwindow
+
+    def runwiener(self,insignal,outsignal,rangesim):
+        N = self.N
+        x = insignal[0:rangesim]
+        d = outsignal[0:rangesim]
+        nfft = fft.next_fast_len(rangesim + N)
+        X = fft.rfft(x,nfft)
+        autocorr = fft.irfft(np.abs(X)**2,nfft)[0:N] / rangesim
+        crosscorr = fft.irfft(np.conj(X) * fft.rfft(d,nfft),nfft)[0:N] / rangesim
+        autocorr[0] += self.psi
+        self.ww = linalg.solve_toeplitz(autocorr,crosscorr)
+        self.sqerror = (d - signal.oaconvolve(x,self.ww)[0:rangesim])**2
+        if self.wwavgwindow:
+            self.wwavg = self.ww.copy()
 
 class FIRFxNLMS:
 
@@ -58,23 +122,26 @@ class FIRFxNLMS:
 		if (memsec > 0):
 			sf.memsec = memsec
 			sf.wwsec = np.zeros(memsec) # Sec. path coefficient vector      
-			sf.xxf = np.zeros(mem)
 		else:
 			sf.memsec = 0
 		sf.vecsize = (mem if (mem > memsec) else memsec)
-		sf.xx = np.zeros(sf.vecsize) # Input vector
+		sf.xxline = DelayLine(sf.vecsize)
+		sf.xx = sf.xxline.x # Input vector
+		sf.xxfline = DelayLine(mem,trackenergy=True)
+		sf.xxf = sf.xxfline.x # Filtered input vector
+		sf.dw = np.zeros(mem) # Coefficient update (preallocated)
 		sf.y = 0 # Filter output
 		sf.e = 0 # Error
-		sf.norm = 0
 		sf.setAlgorithm('NLMS')
 
 	def reset(sf):
 		sf.ww = np.zeros(sf.mem)
-		sf.xxf = np.zeros(sf.mem)
-		sf.xx = np.zeros(sf.vecsize)
+		sf.xxfline.reset()
+		sf.xxf = sf.xxfline.x
+		sf.xxline.reset()
+		sf.xx = sf.xxline.x
 		sf.y = 0
 		sf.e = 0
-		sf.norm = 0
 
 	def setSecondary(sf,wwsec):
 		sf.wwsec = wwsec
@@ -84,19 +151,22 @@ class FIRFxNLMS:
 		sf.fi = fi
 
 	def evalout(sf,x):
-		sf.xx[1:sf.vecsize] = sf.xx[0:sf.vecsize-1]
-		sf.xx[0] = x
+		sf.xx = sf.xxline.push(x)
 		sf.y = sf.xx[0:sf.mem] @ sf.ww
-		sf.xxf[1:sf.mem] = sf.xxf[0:sf.mem-1]
-		sf.xxf[0] = sf.xx[0:sf.memsec] @ sf.wwsec
+		sf.xxf = sf.xxfline.push(sf.xx[0:sf.memsec] @ sf.wwsec)
 
 	def LMSupdate(sf,e):
-		sf.norm = sf.ww @ sf.ww
-		sf.ww = sf.ww + 2 * sf.mu * e * sf.xxf
+		np.multiply(sf.xxf,2 * sf.mu * e,out=sf.dw)
+		sf.ww += sf.dw
 
 	def NLMSupdate(sf,e):
-		sf.norm = sf.ww @ sf.ww
-		sf.ww = sf.ww + sf.mu * e * sf.xxf / ((sf.xxf@sf.xxf) + sf.fi)
+		np.multiply(sf.xxf,sf.mu * e / (sf.xxfline.energy + sf.fi),out=sf.dw)
+		sf.ww += sf.dw
+
+	@property
+	def norm(sf):
+		# Squared norm of the coefficient vector, evaluated only when requested.
+		return sf.ww @ sf.ww
 
 	def setAlgorithm(sf,alg='NLMS'):
 		if alg == 'LMS':
@@ -112,14 +182,154 @@ class LeakyFxNLMS (FIRFxNLMS):
 		sf.leakfactor = leakfactor
 
 	def LMSupdate(sf,e):
-		sf.norm = sf.ww @ sf.ww
-		sf.ww = sf.leakfactor * sf.ww + 2 * sf.mu * e * sf.xxf
+		np.multiply(sf.xxf,2 * sf.mu * e,out=sf.dw)
+		sf.ww *= sf.leakfactor
+		sf.ww += sf.dw
 
 	def NLMSupdate(sf,e):
-		sf.norm = sf.ww @ sf.ww
-		sf.ww = sf.leakfactor * sf.ww + sf.mu * e * sf.xxf / ((sf.xxf@sf.xxf) + sf.fi)
+		np.multiply(sf.xxf,sf.mu * e / (sf.xxfline.energy + sf.fi),out=sf.dw)
+		sf.ww *= sf.leakfactor
+		sf.ww += sf.dw
 		
 
+class FDAFFxNLMS:
+	"""
+		Filtered-x NLMS in the frequency domain (partitioned-block FDAF with overlap-save).
+		Same interface of FIRFxNLMS (evalout, update, setSecondary, setParams), but the filtered
+		reference and the coefficient update are evaluated once per block of L = blocksize samples
+		using FFTs, with the step size normalized by a smoothed estimate of the power of the filtered
+		reference (so that mu is comparable to the mu of FIRFxNLMS, see adapt()). The output is still
+		evaluated at every sample (no delay) using the coefficients of the last block, so the per-sample
+		cost is O(mem) for the output plus O((mem + memsec)/L * log L) for the adaptation.
+		As in FIRFxNLMS, each error is paired with the last input given to evalout(), so update() can be
+		called either after evalout() of the same sample or before evalout() of the next one.
+		evaloutblock() and updateblock() process whole blocks at once.
+	"""
+
+	def __init__(sf,mem,memsec,blocksize=64,powersmoothing=0.9,powerfloor=0.1,binweight=0.0):
+		sf.mem = mem # Memory size
+		sf.L = blocksize # Block size
+		sf.npart = int(np.ceil(mem/blocksize)) # Number of partitions of the coefficient vector
+		sf.mu = 0.1 # Step-size parameter
+		sf.fi = 1e-6 # Regularization parameter
+		sf.beta = powersmoothing # Forgetting factor of the power estimates
+		sf.powerfloor = powerfloor # Minimum power of each bin, relative to the mean power of the bins
+		sf.binweight = binweight # Weight of the power of each bin in the normalization (see adapt())
+		sf.setSecondary(np.zeros(memsec))
+		sf.reset()
+
+	def reset(sf):
+		L = sf.L
+		sf.ww = np.zeros(sf.mem) # Coefficient vector
+		sf.xxline = DelayLine(sf.mem)
+		sf.xx = sf.xxline.x # Input vector
+		sf.xspec = np.zeros((max(sf.npart,sf.npartsec),L+1),dtype=complex) # Spectra of the last input blocks
+		sf.xfspec = np.zeros((sf.npart,L+1),dtype=complex) # Spectra of the last filtered reference blocks
+		sf.power = np.zeros(L+1) # Power of the filtered reference per bin
+		sf.xprev = np.zeros(L)
+		sf.xfprev = np.zeros(L)
+		sf.xblock = np.zeros(L)
+		sf.eblock = np.zeros(L) # Errors paired with the samples of the last input block
+		sf.nx = 0
+		sf.nblocks = 0
+		sf.y = 0 # Filter output
+		sf.e = 0 # Error
+
+	def setSecondary(sf,wwsec):
+		sf.wwsec = wwsec
+		sf.memsec = wwsec.shape[0]
+		sf.npartsec = int(np.ceil(sf.memsec/sf.L))
+		sf.wsecspec = sf.partitionspectra(wwsec,sf.npartsec)
+		if hasattr(sf,'xspec') and sf.xspec.shape[0] < sf.npartsec:
+			sf.xspec = np.concatenate((sf.xspec,np.zeros((sf.npartsec-sf.xspec.shape[0],sf.L+1),dtype=complex)))
+
+	def setParams(sf,mu,fi):
+		sf.mu = mu
+		sf.fi = fi
+
+	def partitionspectra(sf,w,npart):
+		# Spectra (2L points) of the partitions of w, each one zero-padded to 2L.
+		parts = np.zeros((npart,2*sf.L))
+		parts[:,:sf.L].flat[:w.shape[0]] = w
+		return np.fft.rfft(parts,axis=1)
+
+	def evalout(sf,x):
+		sf.xx = sf.xxline.push(x)
+		sf.y = sf.xx @ sf.ww
+		sf.xblock[sf.nx] = x
+		sf.nx += 1
+		if sf.nx == sf.L:
+			sf.newblock()
+
+	def update(sf,e):
+		# The error is paired with the last input sample; the block is adapted once the error of its last
+		# sample arrives (its filtered reference is already available, see newblock()).
+		sf.e = e
+		pos = sf.nx - 1 if sf.nx > 0 else sf.L - 1
+		sf.eblock[pos] = e
+		if pos == sf.L - 1:
+			sf.adapt()
+
+	def newblock(sf):
+		# Input block complete: filtered reference of the block (overlap-save with the partitioned secondary path).
+		L = sf.L
+		sf.xspec[1:] = sf.xspec[:-1]
+		sf.xspec[0] = np.fft.rfft(np.concatenate((sf.xprev,sf.xblock)))
+		xf = np.fft.irfft((sf.wsecspec * sf.xspec[:sf.npartsec]).sum(axis=0),n=2*L)[L:]
+		sf.xfspec[1:] = sf.xfspec[:-1]
+		sf.xfspec[0] = np.fft.rfft(np.concatenate((sf.xfprev,xf)))
+		if sf.nblocks == 0:
+			sf.power = np.abs(sf.xfspec[0])**2
+		else:
+			sf.power = sf.beta * sf.power + (1 - sf.beta) * np.abs(sf.xfspec[0])**2
+		sf.nblocks += 1
+		sf.xprev = sf.xblock.copy()
+		sf.xfprev = xf
+		sf.nx = 0
+
+	def adapt(sf):
+		# Constrained gradient of each partition. The mean power of the bins of the 2L-point spectra is
+		# about 2L times the variance of the filtered reference, so the normalization npart/2 * mean power
+		# is the input energy (mem * variance) of FIRFxNLMS and each block applies the same update as L
+		# steps of FIRFxNLMS with the same mu, whatever the spectrum of the reference. With binweight > 0,
+		# the normalization moves towards the power of each bin (floored at powerfloor * mean power), so
+		# weak bins converge faster; with a narrowband reference that slows down the dominant bins, and
+		# mu has to be increased accordingly.
+		L = sf.L
+		espec = np.fft.rfft(np.concatenate((np.zeros(L),sf.eblock)))
+		meanpower = sf.power.mean()
+		binpower = np.maximum(sf.power,sf.powerfloor * meanpower)
+		norm = sf.npart / 2 * ((1 - sf.binweight) * meanpower + sf.binweight * binpower) + sf.fi
+		grad = np.fft.irfft(np.conj(sf.xfspec) * espec / norm,n=2*L,axis=1)[:,:L]
+		sf.ww += sf.mu * grad.reshape(-1)[:sf.mem]
+		sf.eblock[:] = 0
+
+	def evaloutblock(sf,x):
+		"""
+			Evaluates the outputs for a whole block of inputs (blocksize samples), equivalent to
+			calling evalout() for every sample. Returns the output vector.
+		"""
+		if (sf.nx != 0) or (x.shape[0] != sf.L):
+			raise Exception("Input must be a block aligned with the blocks of the filter.")
+		sf.xblock[:] = x
+		sf.newblock()
+		y = np.fft.irfft((sf.partitionspectra(sf.ww,sf.npart) * sf.xspec[:sf.npart]).sum(axis=0),n=2*sf.L)[sf.L:]
+		sf.xx = sf.xxline.pushblock(x)
+		sf.y = y[-1]
+		return y
+
+	def updateblock(sf,e):
+		"""
+			Updates the coefficients with a whole block of errors (blocksize samples), equivalent to
+			calling update() for every sample.
+		"""
+		if (sf.nx != 0) or (e.shape[0] != sf.L):
+			raise Exception("Error must be a block aligned with the blocks of the filter.")
+		sf.eblock[:] = e
+		sf.adapt()
+		sf.e = e[-1]
+
+
 class CVAFxNLMS:
 
 	def __init__(sf,mem,memsec=0,mem2=0,memsec2=0):
@@ -133,36 +343,44 @@ class CVAFxNLMS:
 		if (memsec > 0):
 			sf.memsec = memsec
 			sf.wwsec = np.zeros(memsec) # Sec. path coefficient vector      
-			sf.xxf = np.zeros(mem)			
 		else:
 			sf.memsec = 0
 		if (memsec2 > 0):
 			sf.memsec2 = memsec2
 			sf.wwsec2 = np.zeros(memsec2) # Sec. path coefficient vector      
-			sf.xxf2 = np.zeros(mem2)			
 		else:
 			sf.memsec2 = 0
 		sf.vecsize = (mem if (mem > memsec) else memsec)
-		sf.xx = np.zeros(sf.vecsize) # Input vector
+		sf.xxline = DelayLine(sf.vecsize)
+		sf.xx = sf.xxline.x # Input vector
+		sf.xxfline = DelayLine(mem,trackenergy=True)
+		sf.xxf = sf.xxfline.x # Filtered input vector
+		sf.dw = np.zeros(mem) # Coefficient update (preallocated)
 		sf.y = 0 # Filter output
 		sf.vecsize2 = (mem2 if (mem2 > memsec2) else memsec2)
-		sf.xx2 = np.zeros(sf.vecsize2) # Input vector
+		sf.xx2line = DelayLine(sf.vecsize2)
+		sf.xx2 = sf.xx2line.x # Input vector
+		sf.xxf2line = DelayLine(mem2,trackenergy=True)
+		sf.xxf2 = sf.xxf2line.x # Filtered input vector
+		sf.dw2 = np.zeros(mem2) # Coefficient update (preallocated)
 		sf.y2 = 0 # Filter output
 		sf.e = 0 # Error
-		sf.norm = 0
 		sf.setAlgorithm('NLMS')
 
 	def reset(sf):
 		sf.ww = np.zeros(sf.mem)
-		sf.xxf = np.zeros(sf.mem)
-		sf.xx = np.zeros(sf.vecsize)
+		sf.xxfline.reset()
+		sf.xxf = sf.xxfline.x
+		sf.xxline.reset()
+		sf.xx = sf.xxline.x
 		sf.y = 0
 		sf.ww2 = np.zeros(sf.mem2)
-		sf.xxf2 = np.zeros(sf.mem2)
-		sf.xx2 = np.zeros(sf.vecsize2)
+		sf.xxf2line.reset()
+		sf.xxf2 = sf.xxf2line.x
+		sf.xx2line.reset()
+		sf.xx2 = sf.xx2line.x
 		sf.y2 = 0
 		sf.e = 0
-		sf.norm = 0
 
 	def setSecondary(sf,wwsec):
 		sf.wwsec = wwsec
@@ -174,26 +392,31 @@ class CVAFxNLMS:
 		sf.mu2 = mu2
 
 	def evalout(sf,x,x2):
-		sf.xx[1:sf.vecsize] = sf.xx[0:sf.vecsize-1]
-		sf.xx[0] = x
+		sf.xx = sf.xxline.push(x)
 		sf.y1 = sf.xx[0:sf.mem] @ sf.ww
-		sf.xxf[1:sf.mem] = sf.xxf[0:sf.mem-1]
-		sf.xxf[0] = sf.xx[0:sf.memsec] @ sf.wwsec
-		sf.xx2[1:sf.vecsize2] = sf.xx2[0:sf.vecsize2-1]
-		sf.xx2[0] = x2
+		sf.xxf = sf.xxfline.push(sf.xx[0:sf.memsec] @ sf.wwsec)
+		sf.xx2 = sf.xx2line.push(x2)
 		sf.y2 = sf.xx2[0:sf.mem] @ sf.ww2
-		sf.xxf2[1:sf.mem] = sf.xxf2[0:sf.mem-1]
-		sf.xxf2[0] = sf.xx2[0:sf.memsec] @ sf.wwsec2
+		sf.xxf2 = sf.xxf2line.push(sf.xx2[0:sf.memsec] @ sf.wwsec2)
 		sf.y = sf.y1 + sf.y2
 
 	def NLMSupdate(sf,e):
-		normterm = sf.xxf@sf.xxf + sf.xxf2@sf.xxf2 + sf.fi
-		sf.ww = sf.ww + sf.mu * e * sf.xxf / normterm
-		sf.ww2 = sf.ww2 + sf.mu2 * e * sf.xxf2 / normterm
+		normterm = sf.xxfline.energy + sf.xxf2line.energy + sf.fi
+		np.multiply(sf.xxf,sf.mu * e / normterm,out=sf.dw)
+		sf.ww += sf.dw
+		np.multiply(sf.xxf2,sf.mu2 * e / normterm,out=sf.dw2)
+		sf.ww2 += sf.dw2
 
 	def LMSupdate(sf,e):
-		sf.ww = sf.ww + 2 * sf.mu * e * sf.xxf
-		sf.ww2 = sf.ww2 + 2 * sf.mu2 * e * sf.xxf2
+		np.multiply(sf.xxf,2 * sf.mu * e,out=sf.dw)
+		sf.ww += sf.dw
+		np.multiply(sf.xxf2,2 * sf.mu2 * e,out=sf.dw2)
+		sf.ww2 += sf.dw2
+
+	@property
+	def norm(sf):
+		# Squared norm of the coefficient vectors, evaluated only when requested.
+		return sf.ww @ sf.ww + sf.ww2 @ sf.ww2
 
 	def setAlgorithm(sf,alg='NLMS'):
 		if alg == 'LMS':
@@ -1,28 +1,6 @@
 import numpy as np
 
-class FIR:
-    """
-    FIR filter class.
-    """
-    def __init__(self, coeffs):
-        self.w = coeffs
-        self.x = np.zeros(coeffs.shape[0])
-        self.N = coeffs.shape[0]
-    
-    def reset(self):
-        self.x = np.zeros(self.N)
-    
-    def filterstep(self, xsample):
-        self.x[1:] = self.x[:-1]
-        self.x[0] = xsample
-        ysample = self.w @ self.x
-        return ysample
-
-    def filter(self, x):
-        y = np.zeros(x.shape)
-        for k in range(x.shape[0]):
-            y[k] = self.filterstep(x[k])
-        return y
+from .Filters import FIR, DelayLine
 
 
 class FIRFxNLMS:
@@ -35,24 +13,27 @@ class FIRFxNLMS:
 		if (memsec > 0):
 			sf.memsec = memsec
 			sf.wwsec = np.zeros(memsec) # Sec. path coefficient vector      
-			sf.xxf = np.zeros(mem)
 		else:
 			sf.memsec = 0
 		sf.secondaryfilter = None
 		sf.vecsize = (mem if (mem > memsec) else memsec)
-		sf.xx = np.zeros(sf.vecsize) # Input vector
+		sf.xxline = DelayLine(sf.vecsize)
+		sf.xx = sf.xxline.x # Input vector
+		sf.xxfline = DelayLine(mem,trackenergy=True)
+		sf.xxf = sf.xxfline.x # Filtered input vector
+		sf.dw = np.zeros(mem) # Coefficient update (preallocated)
 		sf.y = 0 # Filter output
 		sf.e = 0 # Error
-		sf.norm = 0
 		sf.setAlgorithm('NLMS')
 
 	def reset(sf):
 		sf.ww = np.zeros(sf.mem)
-		sf.xxf = np.zeros(sf.mem)
-		sf.xx = np.zeros(sf.vecsize)
+		sf.xxfline.reset()
+		sf.xxf = sf.xxfline.x
+		sf.xxline.reset()
+		sf.xx = sf.xxline.x
 		sf.y = 0
 		sf.e = 0
-		sf.norm = 0
 		if sf.secondaryfilter is not None:
 			sf.secondaryfilter.reset()
 
@@ -64,19 +45,22 @@ class FIRFxNLMS:
 		sf.fi = fi
 
 	def evalout(sf,x):
-		sf.xx[1:sf.vecsize] = sf.xx[0:sf.vecsize-1]
-		sf.xx[0] = x
+		sf.xx = sf.xxline.push(x)
 		sf.y = sf.xx[0:sf.mem] @ sf.ww
-		sf.xxf[1:sf.mem] = sf.xxf[0:sf.mem-1]
-		sf.xxf[0] = sf.secondaryfilter.filterstep(sf.xx[0])
+		sf.xxf = sf.xxfline.push(sf.secondaryfilter.filterstep(x))
 
 	def LMSupdate(sf,e):
-		sf.norm = sf.ww @ sf.ww
-		sf.ww = sf.ww + 2 * sf.mu * e * sf.xxf
+		np.multiply(sf.xxf,2 * sf.mu * e,out=sf.dw)
+		sf.ww += sf.dw
 
 	def NLMSupdate(sf,e):
-		sf.norm = sf.ww @ sf.ww
-		sf.ww = sf.ww + sf.mu * e * sf.xxf / ((sf.xxf@sf.xxf) + sf.fi)
+		np.multiply(sf.xxf,sf.mu * e / (sf.xxfline.energy + sf.fi),out=sf.dw)
+		sf.ww += sf.dw
+
+	@property
+	def norm(sf):
+		# Squared norm of the coefficient vector, evaluated only when requested.
+		return sf.ww @ sf.ww
 
 	def setAlgorithm(sf,alg='NLMS'):
 		if alg == 'LMS':
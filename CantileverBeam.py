@@ -1,7 +1,80 @@
 # CantileverBeam Module
 
+import hashlib
+import os
+from collections import OrderedDict
+
 import numpy as np
-from scipy import linalg
+from scipy import linalg, signal
+
+
+class ModalCache:
+    '''
+        Cache of the modal decomposition (vmod and freqsHz) of cantilever beams, keyed by the version of
+        the modal computation and the geometry/material parameters (npoints, width, thickness, length,
+        density, elasticmod, nmodes), see CantileverBeam.modalkey().
+        Keeps an in-process LRU with up to maxsize entries and, when cachedir is given, .npz files
+        in that directory shared among processes/sessions.
+    '''
+
+    def __init__(self,maxsize=128,cachedir=None):
+        self.maxsize = maxsize
+        self.cachedir = cachedir
+        self.entries = OrderedDict()
+        self.resetstats()
+
+    def resetstats(self):
+        self.hits = 0
+        self.diskhits = 0
+        self.misses = 0
+
+    def getstats(self):
+        return {'hits': self.hits, 'diskhits': self.diskhits, 'misses': self.misses, 'size': len(self.entries)}
+
+    def clear(self,disk=False):
+        self.entries.clear()
+        if disk and self.cachedir and os.path.isdir(self.cachedir):
+            for fname in os.listdir(self.cachedir):
+                if fname.startswith("modes_") and fname.endswith(".npz"):
+                    os.remove(os.path.join(self.cachedir,fname))
+
+    def filename(self,key):
+        return os.path.join(self.cachedir,f"modes_{hashlib.sha1(repr(key).encode()).hexdigest()}.npz")
+
+    def get(self,key):
+        """
+            Returns copies of (vmod,freqsHz) for the given key or None if not cached.
+        """
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            vmod,freqsHz = self.entries[key]
+            return vmod.copy(),freqsHz.copy()
+        if self.cachedir and os.path.isfile(self.filename(key)):
+            with np.load(self.filename(key)) as data:
+                vmod,freqsHz = data['vmod'],data['freqsHz']
+            self.diskhits += 1
+            self.store(key,vmod,freqsHz)
+            return vmod.copy(),freqsHz.copy()
+        self.misses += 1
+        return None
+
+    def put(self,key,vmod,freqsHz):
+        self.store(key,vmod.copy(),freqsHz.copy())
+        if self.cachedir:
+            os.makedirs(self.cachedir,exist_ok=True)
+            fname = self.filename(key)
+            tmpname = f"{fname[:-4]}_{os.getpid()}.tmp.npz"  # Atomic write, safe for concurrent processes
+            np.savez(tmpname,vmod=vmod,freqsHz=freqsHz)
+            os.replace(tmpname,fname)
+
+    def store(self,key,vmod,freqsHz):
+        if self.maxsize <= 0:
+            return
+        self.entries[key] = (vmod,freqsHz)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
 
 
 class CantileverBeam:
@@ -10,11 +83,15 @@ class CantileverBeam:
     '''
     # Parâmetros gerais:
     m = 1  # massa - sempre 1 para todas as vigas
+    modalcache = ModalCache()  # Compartilhado por todas as vigas (ver ModalCache)
+    modalversion = 2  # Versão de computeModesAndFreqs() na chave do cache: incrementar quando os modos mudarem (ex.: convenção de sinal)
 
     def __init__(self,npoints=60,width=0.05,thickness=0.00575,length=0.58,density=7900,
                     elasticmod=2e11,Tsampling=0.004,nmodes=5,
                     damp=[0.002, 0.002, 0.001, 0.001, 0.001],
-                    forcescaler=1,noisestd=0):
+                    forcescaler=1,noisestd=0,modes=None):
+        # modes: optional (vmod,freqsHz) of this geometry, used as is (no copies), e.g. read-only views
+        # of arrays in shared memory (see SharedArrays). When None, they are computed (or taken from modalcache).
         self.Ts = Tsampling
         self.npoints = npoints
         self.nmodes = nmodes
@@ -28,7 +105,12 @@ class CantileverBeam:
         self.deltax = self.length / (self.npoints - 1)  # Checar isso
         self.rotvelmultiplier = (1 / self.deltax) * 180 / np.pi
         self.magnetdist = 1e-3        
-        self.evaluateModesAndFreqs()
+        if modes is None:
+            self.evaluateModesAndFreqs()
+        else:
+            self.vmod,self.freqsHz = modes
+            if self.vmod.shape != (self.npoints,self.nmodes):
+                raise Exception(f"modes must have shape ({self.npoints},{self.nmodes}), not {self.vmod.shape}.")
         self.memiir = 3
         self.Fs = 1 / self.Ts
         self.wn = 2 * np.pi * self.freqsHz
@@ -43,7 +125,9 @@ class CantileverBeam:
             self.Biir[k,2] = 0
             self.Aiir[k,0] = -2 * np.exp(-self.zeta[k]*self.wn[k]*self.Ts) * np.cos(self.wd[k]*self.Ts)
             self.Aiir[k,1] = np.exp(-2*self.zeta[k]*self.wn[k]*self.Ts)        
+        self.observedpos = None
         self.reset()
+        self.observe(None)  # Sparse-output mode disabled by default
         self.noisestd = noisestd        
         self.setaccelg(False)
 
@@ -60,31 +144,42 @@ class CantileverBeam:
         return x,self.vmod
 
 
+    def modalkey(self):
+        # Key of the modal decomposition in the modal cache, starting with modalversion.
+        return (self.modalversion,int(self.npoints),float(self.width),float(self.thickness),float(self.length),
+                float(self.density),float(self.elasticmod),int(self.nmodes))
+
     def evaluateModesAndFreqs(self):
+        key = self.modalkey()
+        cached = self.modalcache.get(key)
+        if cached is None:
+            self.vmod,self.freqsHz = self.computeModesAndFreqs()
+            self.modalcache.put(key,self.vmod,self.freqsHz)
+        else:
+            self.vmod,self.freqsHz = cached
+
+    def computeModesAndFreqs(self):
         I = (self.width * self.thickness**3) / 12 # Inertial moment
         beam_mass = self.density * self.width * self.thickness * self.length
-        # Mass matrix:
-        M = np.matrix( np.eye(self.npoints) * (beam_mass/self.npoints) )
-        M[0,0] = M[0,0]/2        
-        A = np.zeros((self.npoints,self.npoints))
-        for r in range(self.npoints):
-            for c in range(r+1):
-                k = self.npoints-r
-                l = self.npoints-c
-                A[r,c] = ((self.deltax**3)/(6*self.elasticmod*I)) * (3* k**2 * l - k**3)
-                A[c,r] = A[r,c]
-        K = linalg.inv(A)
-        L = linalg.cholesky(M)
-        Kt = linalg.inv(L.T) @ K @ linalg.inv(L)
-        ww,P = linalg.eig(Kt)
-        ww = np.real(ww)
-        sidxs = np.argsort(ww)
-        U = linalg.inv(L) @ P
-        self.vmod = np.zeros((self.npoints,self.nmodes))
-        self.freqsHz = np.zeros(self.nmodes)
-        for k in range(self.nmodes):
-            self.vmod[:,k] = U[::-1,sidxs[k]]
-            self.freqsHz[k] = np.sqrt(ww[sidxs[k]])/2/np.pi
+        # Lumped masses (diagonal of the mass matrix):
+        mass = np.full(self.npoints,beam_mass/self.npoints)
+        mass[0] = mass[0]/2
+        # Flexibility matrix, A[r,c] = deltax³/(6EI) * (3*k²*l - k³) with k = npoints-max(r,c) and l = npoints-min(r,c):
+        idxs = self.npoints - np.arange(self.npoints,dtype=float)
+        k = np.minimum.outer(idxs,idxs)
+        l = np.maximum.outer(idxs,idxs)
+        A = ((self.deltax**3)/(6*self.elasticmod*I)) * (3 * k**2 * l - k**3)
+        # K v = w² M v with K = inv(A) is solved as the symmetric problem (M^½ A M^½) u = (1/w²) u, v = M^-½ u,
+        # computing only the nmodes largest eigenvalues (lowest frequencies) and no explicit inverses.
+        sqmass = np.sqrt(mass)
+        ww,U = linalg.eigh(sqmass[:,np.newaxis] * A * sqmass[np.newaxis,:],
+                           subset_by_index=[self.npoints-self.nmodes,self.npoints-1])
+        vmod = (U / sqmass[:,np.newaxis])[::-1,::-1]
+        # Sign convention: positive displacement at the free end. C order, as the copies of the modal cache,
+        # so that computed and cached modes give the same round-off.
+        vmod = np.ascontiguousarray(vmod * np.sign(vmod[-1,:]))
+        freqsHz = np.sqrt(1/ww[::-1])/2/np.pi
+        return vmod,freqsHz
 
     def configforcescaler(self,forcescl,magnetdist=1e-3):
         self.forcescaler1 = forcescl
@@ -95,7 +190,10 @@ class CantileverBeam:
         self.f[pos] = self.forcescaler * val
 
     def setforcenl(self,pos,val):
-        self.f[pos] = self.forcescaler1 * val / ( (( self.magnetdist + self.x[pos] ) * 1000) ** 2 )
+        x = self.x[pos]
+        if np.any(np.isnan(x)):  # Position not evaluated in the sparse-output mode: displacement from the modal state
+            x = self.vmod[pos,:] @ ((self.Ts / (self.m*self.wd)) * self.yiir[:self.nmodes,0])
+        self.f[pos] = self.forcescaler1 * val / ( (( self.magnetdist + x ) * 1000) ** 2 )
 
     def setaccelg(self,val):
         if val: 
@@ -121,8 +219,85 @@ class CantileverBeam:
         self.bufdesloc = np.zeros(self.npoints)
         self.bufvel = np.zeros((self.npoints,2))
         self.rotvel = np.zeros(self.npoints)  # Trying to implement rotation velocity, in degrees per second.
+        if self.observedpos is not None:
+            self.maskunobserved()
 
-    def update(self):
+    def observe(self,positions=None,forcepositions=None):
+        """
+            Enable the sparse-output mode, where update() only evaluates the given positions.
+
+            The per-step cost then scales with nmodes x len(positions) instead of nmodes x npoints.
+            Entries of x, a, bufvel and rotvel at non-observed positions are set to NaN; use
+            getfullfield() to evaluate the whole beam on demand (e.g. for plotting).
+
+            Parameters:
+                positions: list of observed positions (for getaccelms2(), getrotationvel(), etc.).
+                           None disables the sparse-output mode.
+                forcepositions: list of positions where forces are applied. When given, forces
+                                set at any other position are ignored in the sparse-output mode.
+        """
+        if positions is None:
+            if self.observedpos is not None:
+                self.observedpos = None
+                self.loadfullfield()
+            self.update = self.updatefull
+            return
+        self.observedpos = np.unique(positions)
+        self.forcepos = None if forcepositions is None else np.unique(forcepositions)
+        # Positions where the displacement must be evaluated: observed ones, their left neighbours
+        # (rotation velocity) and force positions (setforcenl() depends on the displacement).
+        calcpos = [self.observedpos,np.maximum(self.observedpos-1,0)]
+        if self.forcepos is not None:
+            calcpos.append(self.forcepos)
+        self.calcpos = np.unique(np.concatenate(calcpos))
+        self.unobservedpos = np.setdiff1d(np.arange(self.npoints),self.calcpos)
+        self.rotvelpos = self.observedpos[self.observedpos > 0]
+        self.vmodcalc = self.vmod[self.calcpos,:]
+        self.vmodforce = self.vmod if self.forcepos is None else self.vmod[self.forcepos,:]
+        self.modalcoef = self.Ts / (self.m*self.wd)
+        self.loadfullfield()
+        self.maskunobserved()
+        self.update = self.updatesparse
+
+    def maskunobserved(self):
+        self.x[self.unobservedpos] = np.nan
+        self.a[self.unobservedpos] = np.nan
+        self.bufdesloc[self.unobservedpos] = np.nan
+        self.bufvel[self.unobservedpos,:] = np.nan
+        self.rotvel[self.unobservedpos] = np.nan
+
+    def modaldisplacements(self):
+        # Displacements of all positions at the last three updates, evaluated from the modal state.
+        q = (self.Ts / (self.m*self.wd))[:,np.newaxis] * self.yiir[:self.nmodes,0:3]
+        return self.vmod @ q
+
+    def loadfullfield(self):
+        # Rebuilds x, bufdesloc, bufvel, a and rotvel at all positions from the modal state.
+        xx = self.modaldisplacements()
+        self.x = xx[:,0].copy()
+        self.bufdesloc = xx[:,1].copy()
+        self.bufvel = np.stack(((xx[:,0] - xx[:,1]) * self.Fs,(xx[:,1] - xx[:,2]) * self.Fs),axis=1)
+        self.a = (self.bufvel[:,0] - self.bufvel[:,1]) * self.Fs
+        self.rotvel = np.zeros(self.npoints)
+        self.rotvel[1:] = (self.bufvel[1:,0] - self.bufvel[:-1,0]) * self.rotvelmultiplier
+
+    def getfullfield(self):
+        """
+            Evaluate the current state of the whole beam from the modal state.
+            Useful in the sparse-output mode (see observe()), where only some positions are updated.
+
+            Returns: (x,vel,a,rotvel)
+                Displacement, velocity, acceleration (m/s²) and rotation velocity (degrees/s)
+                at all the npoints positions.
+        """
+        xx = self.modaldisplacements()
+        vel = (xx[:,0] - xx[:,1]) * self.Fs
+        a = (vel - (xx[:,1] - xx[:,2]) * self.Fs) * self.Fs
+        rotvel = np.zeros(self.npoints)
+        rotvel[1:] = (vel[1:] - vel[:-1]) * self.rotvelmultiplier
+        return xx[:,0],vel,a,rotvel
+
+    def updatefull(self):
         self.bufvel[:,1] = self.bufvel[:,0]
         self.bufdesloc[:] = self.x
         self.x = np.zeros(self.npoints)
@@ -134,4 +309,325 @@ class CantileverBeam:
             self.x = self.x + self.Ts / (self.m*self.wd[k]) * self.yiir[k,0] * self.vmod[:,k]        
         self.bufvel[:,0] = (self.x - self.bufdesloc) * self.Fs
         self.a = (self.bufvel[:,0] - self.bufvel[:,1]) * self.Fs
-        self.rotvel[1:] = (self.bufvel[1:,0] - self.bufvel[:-1,0]) * self.rotvelmultiplier
\ No newline at end of file
+        self.rotvel[1:] = (self.bufvel[1:,0] - self.bufvel[:-1,0]) * self.rotvelmultiplier
+
+    def updatesparse(self):
+        # Sparse-output mode update, evaluating only the positions in self.calcpos.
+        nm = self.nmodes
+        pos = self.calcpos
+        self.xiir[:nm,1:] = self.xiir[:nm,:-1]
+        if self.forcepos is None:
+            self.xiir[:nm,0] = self.f @ self.vmodforce
+        else:
+            self.xiir[:nm,0] = self.f[self.forcepos] @ self.vmodforce
+        self.yiir[:nm,1:] = self.yiir[:nm,:-1]
+        self.yiir[:nm,0] = (self.Biir * self.xiir[:nm,:]).sum(axis=1) - (self.Aiir * self.yiir[:nm,1:]).sum(axis=1)
+        xnew = self.vmodcalc @ (self.modalcoef * self.yiir[:nm,0])
+        self.bufdesloc[pos] = self.x[pos]
+        self.x[pos] = xnew
+        self.bufvel[pos,1] = self.bufvel[pos,0]
+        self.bufvel[pos,0] = (xnew - self.bufdesloc[pos]) * self.Fs
+        self.a[pos] = (self.bufvel[pos,0] - self.bufvel[pos,1]) * self.Fs
+        pos = self.rotvelpos
+        self.rotvel[pos] = (self.bufvel[pos,0] - self.bufvel[pos-1,0]) * self.rotvelmultiplier
+
+    def update_block(self,forces,inpos,outpos):
+        """
+            Advance the beam by a block of samples in a single call.
+
+            Equivalent to calling setforce() for every position in inpos followed by update(),
+            once per row of forces, but the modal IIR recursions run with scipy.signal.lfilter
+            and only the positions in outpos are projected. Results match the step-by-step
+            simulation up to floating point round-off and the beam state is left exactly as
+            update() would leave it, so both APIs can be mixed freely.
+            Forces at positions not listed in inpos keep their current values. In the sparse-output
+            mode, forces at positions other than forcepositions are ignored, as in update().
+            Noise (noisestd) is not added to the returned traces.
+
+            Parameters:
+                forces: array (samples x len(inpos)) with the forces applied at each update
+                        (1-D when a single position is given).
+                inpos: position (or list of positions) where the forces are applied.
+                outpos: position (or list of positions) to be observed.
+            Returns: (x,vel,a,rotvel)
+                Displacement, velocity, acceleration (m/s²) and rotation velocity (degrees/s)
+                after each update, with shape (samples x len(outpos)) or (samples,) when outpos
+                is a single position.
+        """
+        inpos = np.atleast_1d(inpos)
+        outidx = np.atleast_1d(outpos)
+        forces = np.asarray(forces,dtype=float).reshape((-1,inpos.shape[0]))
+        nsamples = forces.shape[0]
+        nout = outidx.shape[0]
+        nm = self.nmodes
+        # As in updatesparse(), forces at positions other than forcepositions are ignored in the sparse-output mode
+        active = np.ones(self.npoints)
+        if (self.observedpos is not None) and (self.forcepos is not None):
+            active = np.zeros(self.npoints)
+            active[self.forcepos] = 1
+        fother = self.f * active
+        fother[inpos] = 0
+        # Modal forces (inputs of the IIR filters of each mode)
+        u = (self.forcescaler * forces * active[inpos]) @ self.vmod[inpos,:] + fother @ self.vmod
+        y = np.zeros((nsamples,nm))
+        for k in range(nm):
+            acoefs = np.concatenate(([1.0],self.Aiir[k,:]))
+            zi = signal.lfiltic(self.Biir[k,:],acoefs,y=self.yiir[k,0:2],x=self.xiir[k,0:2])
+            y[:,k] = signal.lfilter(self.Biir[k,:],acoefs,u[:,k],zi=zi)[0]
+        q = y * (self.Ts / (self.m*self.wd))  # Modal displacements
+        # Output positions followed by their left neighbours (needed for the rotation velocity)
+        pos = np.concatenate((outidx,np.maximum(outidx-1,0)))
+        xp = q @ self.vmod[pos,:].T
+        # Displacements at the last two updates before the block, from the modal state (x and bufvel hold NaN
+        # at the positions not observed in the sparse-output mode):
+        xlast2 = self.vmod[pos,:] @ ((self.Ts / (self.m*self.wd))[:,np.newaxis] * self.yiir[:nm,0:2])
+        vel = np.diff(xp,axis=0,prepend=xlast2[np.newaxis,:,0]) * self.Fs
+        vellast = (xlast2[:nout,0] - xlast2[:nout,1]) * self.Fs
+        a = np.diff(vel[:,:nout],axis=0,prepend=vellast[np.newaxis,:]) * self.Fs
+        rotvel = (vel[:,:nout] - vel[:,nout:]) * self.rotvelmultiplier
+        rotvel[:,outidx == 0] = 0  # Not evaluated at the clamped end
+        xout = xp[:,:nout]
+        vel = vel[:,:nout]
+        # Leaving the internal state as update() would:
+        if nsamples > 0:
+            self.f[inpos] = self.forcescaler * forces[-1,:]
+            yall = np.concatenate((self.yiir[:nm,::-1].T,y))[-self.memiir:]
+            uall = np.concatenate((self.xiir[:nm,::-1].T,u))[-self.memiir:]
+            self.yiir[:nm,:] = yall[::-1].T
+            self.xiir[:nm,:] = uall[::-1].T
+            xlast = self.vmod @ q[-1,:]
+            if nsamples == 1:
+                xprev = self.x
+                velprev = self.bufvel[:,0].copy()
+            else:
+                xprev = self.vmod @ q[-2,:]
+                xprev2 = self.vmod @ q[-3,:] if nsamples > 2 else self.x
+                velprev = (xprev - xprev2) * self.Fs
+            self.bufdesloc[:] = xprev
+            self.x = xlast
+            self.bufvel[:,1] = velprev
+            self.bufvel[:,0] = (self.x - self.bufdesloc) * self.Fs
+            self.a = (self.bufvel[:,0] - self.bufvel[:,1]) * self.Fs
+            self.rotvel[1:] = (self.bufvel[1:,0] - self.bufvel[:-1,0]) * self.rotvelmultiplier
+            if self.observedpos is not None:
+                self.maskunobserved()
+        if np.ndim(outpos) == 0:
+            return xout[:,0],vel[:,0],a[:,0],rotvel[:,0]
+        return xout,vel,a,rotvel
+
+    def to_statespace(self,inputs,outputs,output='accel'):
+        """
+            Exact discrete-time state-space model of the beam for the given force and sensor positions.
+
+            Each mode contributes three states, [u[n-1], y[n-1], y[n-2]], where u is the modal force and
+            y the output of the modal IIR filter (see update()). Input n of the model is the force set
+            (with setforce()) before the n-th update() and output n is the value read after it, so
+            scipy.signal.dlsim reproduces the step-by-step simulation (without noise).
+            Use statevector() as initial state (x0) to continue from the current beam state.
+
+            Parameters:
+                inputs: list of force positions.
+                outputs: list of sensor positions.
+                output: 'accel' (m/s²), 'vel' (m/s), 'disp' (m) or 'rotvel' (degrees/s).
+            Returns:
+                scipy.signal.StateSpace (dlti with sampling period Ts), matrices available as .A, .B, .C and .D.
+        """
+        inputs = np.atleast_1d(inputs)
+        outputs = np.atleast_1d(outputs)
+        nm = self.nmodes
+        nstates = 3 * nm
+        A = np.zeros((nstates,nstates))
+        B = np.zeros((nstates,inputs.shape[0]))
+        C = np.zeros((outputs.shape[0],nstates))
+        # Rows that combined with the state give y[n], y[n-1] and y[n-2] of each mode:
+        rowcur = np.stack((self.Biir[:nm,1],-self.Aiir[:nm,0],-self.Aiir[:nm,1]),axis=1)
+        rowprev = np.tile([0.0,1.0,0.0],(nm,1))
+        rowprev2 = np.tile([0.0,0.0,1.0],(nm,1))
+        vmodout = self.vmod[outputs,:]
+        if output == 'disp':
+            rows = rowcur
+        elif output == 'vel':
+            rows = (rowcur - rowprev) * self.Fs
+        elif output == 'accel':
+            rows = (rowcur - 2*rowprev + rowprev2) * self.Fs**2
+        elif output == 'rotvel':
+            rows = (rowcur - rowprev) * self.Fs * self.rotvelmultiplier
+            vmodout = vmodout - self.vmod[np.maximum(outputs-1,0),:]  # Zero at position 0
+        else:
+            raise Exception("Invalid output, must be 'accel', 'vel', 'disp' or 'rotvel'.")
+        modalcoef = self.Ts / (self.m*self.wd[:nm])
+        for k in range(nm):
+            idxs = slice(3*k,3*k+3)
+            A[3*k+1,idxs] = rowcur[k,:]
+            A[3*k+2,3*k+1] = 1
+            B[3*k,:] = self.forcescaler * self.vmod[inputs,k]
+            C[:,idxs] = (modalcoef[k] * vmodout[:,k])[:,np.newaxis] * rows[k,:]
+        D = np.zeros((outputs.shape[0],inputs.shape[0]))
+        return signal.StateSpace(A,B,C,D,dt=self.Ts)
+
+    def modalgains(self,inputs,outputs,output):
+        # Gains (len(inputs) x len(outputs) x nmodes) from the modal IIR outputs to the chosen output.
+        vmodout = self.vmod[outputs,:]
+        if output == 'rotvel':
+            vmodout = (vmodout - self.vmod[np.maximum(outputs-1,0),:]) * self.rotvelmultiplier
+        elif output not in ('accel','vel','disp'):
+            raise Exception("Invalid output, must be 'accel', 'vel', 'disp' or 'rotvel'.")
+        modalcoef = self.forcescaler * self.Ts / (self.m*self.wd[:self.nmodes])
+        return self.vmod[inputs,np.newaxis,:] * vmodout[np.newaxis,:,:] * modalcoef
+
+    def impulseresponse(self,inputs,outputs,nsamples,output='accel'):
+        """
+            Impulse responses evaluated in closed form from the modal parameters, without time-stepping.
+            Sample n is the value read after the n-th update() when a unit force is set at the input
+            position only before the first update() (noise not included).
+
+            Parameters:
+                inputs: force position or list of force positions.
+                outputs: sensor position or list of sensor positions.
+                nsamples: length of the impulse responses.
+                output: 'accel' (m/s²), 'vel' (m/s), 'disp' (m) or 'rotvel' (degrees/s).
+            Returns:
+                Array (len(inputs) x len(outputs) x nsamples) with the responses of all input/output
+                pairs (the first dimensions are dropped for scalar inputs/outputs).
+        """
+        nm = self.nmodes
+        nTs = np.arange(nsamples)[:,np.newaxis] * self.Ts
+        # Impulse response of the modal IIR filters: exp(-zeta*wn*n*Ts) * sin(wd*n*Ts)
+        y = np.exp(-self.zeta[:nm]*self.wn*nTs) * np.sin(self.wd[:nm]*nTs)
+        if output != 'disp':
+            y = np.diff(y,axis=0,prepend=0) * self.Fs
+        if output == 'accel':
+            y = np.diff(y,axis=0,prepend=0) * self.Fs
+        h = self.modalgains(np.atleast_1d(inputs),np.atleast_1d(outputs),output) @ y.T
+        return h.reshape(np.shape(inputs) + np.shape(outputs) + (nsamples,))
+
+    def freqresponse(self,inputs,outputs,freqs,output='accel'):
+        """
+            Complex frequency responses (DTFT of impulseresponse()) evaluated in closed form from the
+            modal parameters.
+
+            Parameters:
+                inputs: force position or list of force positions.
+                outputs: sensor position or list of sensor positions.
+                freqs: frequencies (Hz).
+                output: 'accel' (m/s²), 'vel' (m/s), 'disp' (m) or 'rotvel' (degrees/s).
+            Returns:
+                Complex array (len(inputs) x len(outputs) x len(freqs)) with the responses of all
+                input/output pairs (the first dimensions are dropped for scalar inputs/outputs).
+        """
+        nm = self.nmodes
+        zinv = np.exp(-2j*np.pi*np.atleast_1d(freqs).astype(float)*self.Ts)[:,np.newaxis]
+        # Modal IIR filters: Biir[1] z^-1 / (1 + Aiir[0] z^-1 + Aiir[1] z^-2)
+        hmodes = self.Biir[:nm,1] * zinv / (1 + self.Aiir[:nm,0] * zinv + self.Aiir[:nm,1] * zinv**2)
+        if output != 'disp':
+            hmodes = hmodes * (1 - zinv) * self.Fs
+        if output == 'accel':
+            hmodes = hmodes * (1 - zinv) * self.Fs
+        h = self.modalgains(np.atleast_1d(inputs),np.atleast_1d(outputs),output) @ hmodes.T
+        return h.reshape(np.shape(inputs) + np.shape(outputs) + np.shape(freqs))
+
+    def statevector(self):
+        """
+            Current state of the beam in the form used by to_statespace().
+        """
+        nm = self.nmodes
+        return np.stack((self.xiir[:nm,0],self.yiir[:nm,0],self.yiir[:nm,1]),axis=1).reshape(3*nm)
+
+
+class CantileverBeamBatch:
+    '''
+        Batch of nbatch independent cantilever beams with the same geometry, simulated in lockstep.
+        Equivalent to a list of CantileverBeam objects, but the states are stacked arrays (first
+        dimension is the batch) and setforce()/update()/getaccelms2() operate on all beams at once.
+        Damping factors (damp), noise (noisestd) and force scaler may differ among the beams:
+        damp accepts a (nbatch x nmodes) array and noisestd/forcescaler accept vectors of length nbatch.
+        The mode shapes (vmod) are shared among the beams.
+    '''
+    m = 1  # massa - sempre 1 para todas as vigas
+
+    def __init__(self,nbatch,npoints=60,width=0.05,thickness=0.00575,length=0.58,density=7900,
+                    elasticmod=2e11,Tsampling=0.004,nmodes=5,
+                    damp=[0.002, 0.002, 0.001, 0.001, 0.001],
+                    forcescaler=1,noisestd=0,modes=None):
+        self.nbatch = nbatch
+        # Single beam used as template for the geometry and the modal decomposition:
+        self.beam = CantileverBeam(npoints=npoints,width=width,thickness=thickness,length=length,
+                                   density=density,elasticmod=elasticmod,Tsampling=Tsampling,nmodes=nmodes,
+                                   damp=np.atleast_2d(damp)[0,:],forcescaler=1,noisestd=0,modes=modes)
+        self.Ts = Tsampling
+        self.Fs = 1 / self.Ts
+        self.npoints = npoints
+        self.nmodes = nmodes
+        self.length = length
+        self.memiir = self.beam.memiir
+        self.rotvelmultiplier = self.beam.rotvelmultiplier
+        self.vmod = self.beam.vmod
+        self.freqsHz = self.beam.freqsHz
+        self.wn = self.beam.wn
+        self.zeta = np.broadcast_to(np.atleast_2d(damp)[:,:self.nmodes],(nbatch,self.nmodes)).copy()
+        self.wd = self.wn * np.sqrt(1-self.zeta**2)
+        # Coefs dos filtros IIR de cada modo e de cada viga (nbatch x nmodes x memiir)
+        decay = np.exp(-self.zeta*self.wn*self.Ts)
+        self.Biir = np.zeros((nbatch,self.nmodes,self.memiir))
+        self.Biir[:,:,1] = decay * np.sin(self.wd*self.Ts)
+        self.Aiir = np.zeros((nbatch,self.nmodes,self.memiir-1))
+        self.Aiir[:,:,0] = -2 * decay * np.cos(self.wd*self.Ts)
+        self.Aiir[:,:,1] = decay**2
+        self.modalcoef = self.Ts / (self.m*self.wd)
+        self.forcescaler = np.broadcast_to(forcescaler,(nbatch,)).copy()
+        self.forcescaler1 = self.forcescaler.copy()
+        self.magnetdist = 1e-3
+        self.noisestd = np.broadcast_to(noisestd,(nbatch,)).copy()
+        self.reset()
+        self.setaccelg(False)
+
+    def getModeShapes(self):
+        return self.beam.getModeShapes()
+
+    def configforcescaler(self,forcescl,magnetdist=1e-3):
+        self.forcescaler1 = np.broadcast_to(forcescl,(self.nbatch,)).copy()
+        self.forcescaler = self.forcescaler1 / ( (magnetdist * 1000) ** 2 )
+        self.magnetdist = magnetdist
+
+    def setforce(self,pos,val):
+        self.f[:,pos] = self.forcescaler * val
+
+    def setforcenl(self,pos,val):
+        self.f[:,pos] = self.forcescaler1 * val / ( (( self.magnetdist + self.x[:,pos] ) * 1000) ** 2 )
+
+    def setaccelg(self,val):
+        if val:
+            self.getaccel = self.getaccelg
+        else:
+            self.getaccel = self.getaccelms2
+
+    def getaccelms2(self,pos):
+        return self.a[:,pos] + np.random.randn(self.nbatch)*self.noisestd
+
+    def getaccelg(self,pos):
+        return (self.a[:,pos] + np.random.randn(self.nbatch)*self.noisestd)/9.80665
+
+    def getrotationvel(self,pos):
+        return self.rotvel[:,pos] + np.random.randn(self.nbatch)*self.noisestd
+
+    def reset(self):
+        self.f = np.zeros((self.nbatch,self.npoints))
+        self.x = np.zeros((self.nbatch,self.npoints))
+        self.a = np.zeros((self.nbatch,self.npoints))
+        self.xiir = np.zeros((self.nbatch,self.nmodes,self.memiir))
+        self.yiir = np.zeros((self.nbatch,self.nmodes,self.memiir))
+        self.bufdesloc = np.zeros((self.nbatch,self.npoints))
+        self.bufvel = np.zeros((self.nbatch,self.npoints,2))
+        self.rotvel = np.zeros((self.nbatch,self.npoints))
+
+    def update(self):
+        self.bufvel[:,:,1] = self.bufvel[:,:,0]
+        self.bufdesloc[:] = self.x
+        self.xiir[:,:,1:] = self.xiir[:,:,:-1]
+        self.xiir[:,:,0] = self.f @ self.vmod
+        self.yiir[:,:,1:] = self.yiir[:,:,:-1]
+        self.yiir[:,:,0] = (self.Biir * self.xiir).sum(axis=2) - (self.Aiir * self.yiir[:,:,1:]).sum(axis=2)
+        self.x = (self.modalcoef * self.yiir[:,:,0]) @ self.vmod.T
+        self.bufvel[:,:,0] = (self.x - self.bufdesloc) * self.Fs
+        self.a = (self.bufvel[:,:,0] - self.bufvel[:,:,1]) * self.Fs
+        self.rotvel[:,1:] = (self.bufvel[:,1:,0] - self.bufvel[:,:-1,0]) * self.rotvelmultiplier
@@ -1,16 +1,139 @@
 import numpy as np
 from scipy import signal
+from scipy import fft as sfft
+
+
+def spectrum(x, fs: float = 1.0, N: int = None, axis: int = 0, window=None, nperseg: int = None,
+             overlap: float = 0.5, nfft: int = None, fastlen: bool = False, phasealso: bool = False):
+  """
+    Magnitude spectrum in dB (amplitude of sinusoids: 20*log10(2*|X|/sum(window))) via the real FFT.
+    Parameters:
+      x: signal in time (N-D arrays are transformed along axis, e.g. samples x channels).
+      fs: the sampling frequency.
+      N: approximate number of output frequency bins; bins are reduced in groups keeping the maximum of
+         each group (and its frequency), so that peaks are preserved.
+      window: window name or tuple accepted by scipy.signal.get_window (rectangular when None).
+      nperseg: if given, Welch averaging (power mean) of segments of nperseg samples with the given overlap
+               (fraction of nperseg).
+      nfft: FFT length (length of the signal or segment when None), padded up to a fast length if fastlen.
+      phasealso: also return the phase (not available with Welch averaging).
+    Returns: (magdb,freqs) or (magdb,freqs,phase), with the frequency bins along axis. When N reduces the
+             bins of multichannel inputs, freqs has the same shape as magdb (frequency of each maximum).
+  """
+  x = np.moveaxis(np.asarray(x),axis,0)
+  nsamples = x.shape[0]
+  if nperseg is None:
+    seglen = nsamples
+    segs = x[np.newaxis]
+  else:
+    if phasealso:
+      raise BaseException("Phase is not available with Welch averaging (nperseg).")
+    seglen = min(nperseg,nsamples)
+    step = max(int(round(seglen * (1 - overlap))),1)
+    starts = np.arange(0,nsamples - seglen + 1,step)
+    segs = x[starts[:,np.newaxis] + np.arange(seglen)]
+  if not nfft:
+    nfft = seglen
+  if fastlen:
+    nfft = sfft.next_fast_len(nfft,real=True)
+  w = np.ones(seglen) if window is None else signal.get_window(window,seglen)
+  X = sfft.rfft(segs * w.reshape((seglen,) + (1,) * (x.ndim - 1)),n=nfft,axis=1)
+  scale = 2 / np.sum(w)
+  if nperseg is None:
+    mag = np.abs(X[0]) * scale
+  else:
+    mag = np.sqrt(np.mean(np.abs(X)**2,axis=0)) * scale
+  magdb = 20*np.log10(mag)
+  freqs = sfft.rfftfreq(nfft,1/fs)
+  outs = [magdb,freqs] + ([np.angle(X[0])] if phasealso else [])
+  if N:
+    outs = reducebins(N,*outs)
+  # Frequency bins back to the requested axis:
+  return tuple(np.moveaxis(o,0,axis) if o.ndim == x.ndim else o for o in outs)
+
+
+def reducebins(N, magdb, freqs, *others, factor: int = None):
+  """
+    Reduces the frequency bins (first axis) to about N by keeping the maximum of magdb in each group of
+    consecutive bins, with the corresponding freqs and other arrays (e.g. phase). Unlike striding ([::factor]),
+    peaks are preserved. factor (number of bins per group) overrides N.
+  """
+  nbins = magdb.shape[0]
+  if factor is None:
+    factor = int(np.ceil(float(nbins)/float(N)))
+  if factor <= 1:
+    return (magdb,freqs) + others
+  ngroups = int(np.ceil(nbins/factor))
+  pad = ngroups * factor - nbins
+  padded = np.concatenate((magdb,np.full((pad,) + magdb.shape[1:],-np.inf)),axis=0)
+  idx = np.argmax(padded.reshape((ngroups,factor) + magdb.shape[1:]),axis=1)
+  idx = idx + (np.arange(ngroups) * factor).reshape((ngroups,) + (1,) * (magdb.ndim - 1))
+  freqsb = np.broadcast_to(freqs.reshape((nbins,) + (1,) * (magdb.ndim - 1)),magdb.shape)
+  reduced = [np.take_along_axis(magdb,idx,axis=0),np.take_along_axis(freqsb,idx,axis=0)]
+  reduced += [np.take_along_axis(o,idx,axis=0) for o in others]
+  if magdb.ndim == 1:
+    reduced[1] = reduced[1].reshape(-1)
+  return tuple(reduced)
+
+
+class SpectrumAccumulator():
+  """
+    Streaming version of spectrum() with Welch averaging: process() takes consecutive chunks of the signal
+    (e.g. from ActVibData.iter_chunks) and accumulates the power of the segments, keeping only the samples of
+    the incomplete segment; result() gives the same spectrum as spectrum(x,...,nperseg=nperseg) on the
+    whole signal.
+  """
+  def __init__(sf,fs=1.0,nperseg=1024,axis=0,window=None,overlap=0.5,nfft=None,fastlen=False):
+    sf.fs = fs
+    sf.nperseg = nperseg
+    sf.axis = axis
+    sf.step = max(int(round(nperseg * (1 - overlap))),1)
+    sf.nfft = nfft if nfft else nperseg
+    if fastlen:
+      sf.nfft = sfft.next_fast_len(sf.nfft,real=True)
+    sf.w = np.ones(nperseg) if window is None else signal.get_window(window,nperseg)
+    sf.reset()
+
+  def reset(sf):
+    sf.pending = None
+    sf.power = 0
+    sf.nsegs = 0
+
+  def process(sf,chunk):
+    chunk = np.moveaxis(np.asarray(chunk),sf.axis,0)
+    x = chunk if sf.pending is None else np.concatenate((sf.pending,chunk),axis=0)
+    starts = np.arange(0,x.shape[0] - sf.nperseg + 1,sf.step)
+    if starts.shape[0] > 0:
+      segs = x[starts[:,np.newaxis] + np.arange(sf.nperseg)]
+      X = sfft.rfft(segs * sf.w.reshape((sf.nperseg,) + (1,) * (x.ndim - 1)),n=sf.nfft,axis=1)
+      sf.power = sf.power + np.sum(np.abs(X)**2,axis=0)
+      sf.nsegs += starts.shape[0]
+    sf.pending = x[starts.shape[0] * sf.step:].copy()
+
+  def result(sf,N: int = None):
+    """
+      Returns (magdb,freqs) of the segments processed so far (see spectrum()).
+    """
+    if sf.nsegs == 0:
+      raise BaseException("Not enough samples for a segment of nperseg samples.")
+    magdb = 20*np.log10(np.sqrt(sf.power / sf.nsegs) * 2 / np.sum(sf.w))
+    outs = [magdb,sfft.rfftfreq(sf.nfft,1/sf.fs)]
+    if N:
+      outs = reducebins(N,*outs)
+    return tuple(np.moveaxis(o,0,sf.axis) if o.ndim == magdb.ndim else o for o in outs)
+
 
 def easyFourier(x: np.ndarray, fs: float = 1.0, N: int = None, phasealso: bool = False, downsamplemode: str = "decimate"):
   """
-    Evaluate the magnitude Fourier spectrum in dB using the FFT.
+    Evaluate the magnitude Fourier spectrum in dB using the FFT (see spectrum() for windowing, Welch
+    averaging and multichannel signals).
     Parameters:
       x: vector containing the signal in time.
       fs: the sampling frequency. 
       N: Either the number of samples for the transformed signal (when downsamplemode = "truncate") 
          or the approximate number os samples of the transformed signal (when downsamplemode = "decimate")
          (must be smaller than or equal to the length of x)
-         (WARNING: obtained via decimation, data may be lost).
+         (obtained keeping the maximum of each group of bins, so that peaks are preserved).
       downsamplemode: "decimate" (where the whole signal is considered when carrying out the FFT) or
                       "truncate" (considers only the first N samples of the signal - standard for numpy.fft)
     Returns: (magdb,freqvec)
@@ -19,64 +142,85 @@ def easyFourier(x: np.ndarray, fs: float = 1.0, N: int = None, phasealso: bool =
   """
   nsamples = x.shape[0]
   if downsamplemode == "decimate":
-    fftaux = np.fft.fft(x)
-    magdb = 20*np.log10( 2*np.abs(fftaux/nsamples)[0:int(np.floor(nsamples/2))] )
-    freqs = (np.fft.fftfreq(nsamples) * fs)[0:magdb.shape[0]]
+    outs = spectrum(x,fs=fs,phasealso=phasealso)
+    outs = [o[0:int(np.floor(nsamples/2))] for o in outs]
     if N:
-      factor = int(np.ceil(float(nsamples)/float(N)))
-      if phasealso:
-        return magdb[::factor],freqs[::factor],np.angle(fftaux[0:int(np.floor(nsamples/2))][::factor])
-      else:
-        return magdb[::factor],freqs[::factor]
-    else:
-      if phasealso:
-        return magdb,freqs,np.angle(fftaux[0:int(np.floor(nsamples/2))])
-      else:
-        return magdb,freqs
+      outs = reducebins(N,*outs,factor=int(np.ceil(float(nsamples)/float(N))))
+    return tuple(outs)
   elif downsamplemode == "truncate":
     if not N:
       N = nsamples
-    fftaux = np.fft.fft(x,N)
-    magdb = 20*np.log10( 2*np.abs(fftaux/N)[0:int(np.floor(N/2))] )
-    freqs = (np.fft.fftfreq(N) * fs)[0:magdb.shape[0]]
-    if phasealso:
-      return magdb,freqs,np.angle(fftaux[0:int(np.floor(nsamples/2))])
-    else:
-      return magdb,freqs
+    xn = np.concatenate((x[0:N],np.zeros(max(N - nsamples,0))))  # As numpy.fft.fft(x,N)
+    outs = spectrum(xn,fs=fs,phasealso=phasealso)
+    return tuple(o[0:int(np.floor(N/2))] for o in outs)
   else:
     raise BaseException("Invalid value for downsamplemode.")
 
 
-def ARSmooth(sig,coef=0.95):
+def ARSmooth(sig,coef=0.95,axis=0,last=0):
   """
-    AR signal smoother.
-    - sig is the signal;
-    - coef is the AR coef.
+    AR signal smoother: out[n] = coef*out[n-1] + sig[n]*(1-coef).
+    - sig is the signal (N-D arrays are filtered along axis);
+    - coef is the AR coef;
+    - last is the output before the first sample (scalar or one value per channel).
   """
-  last = 0
-  out = np.zeros(sig.shape)
-  for n in range(0,sig.shape[0]):
-    out[n] = coef*last + sig[n]*(1-coef)
-    last = out[n]
+  sig = np.asarray(sig)
+  zi = np.expand_dims(coef * np.broadcast_to(last,np.delete(sig.shape,axis)),axis)
+  out,_ = signal.lfilter([1-coef],[1,-coef],sig,axis=axis,zi=zi)
   return out
 
 
+class ARSmoother():
+  """
+    Streaming version of ARSmooth: process() keeps the last output across chunks.
+  """
+  def __init__(sf,coef=0.95,axis=0):
+    sf.coef = coef
+    sf.axis = axis
+    sf.reset()
+
+  def reset(sf,last=0):
+    sf.last = last
+
+  def process(sf,chunk):
+    out = ARSmooth(chunk,sf.coef,sf.axis,sf.last)
+    if out.shape[sf.axis] > 0:  # An empty chunk leaves the state untouched
+      sf.last = np.take(out,-1,axis=sf.axis)
+    return out
+
+
 class DCRemover():
   
   # http://sam-koblenski.blogspot.com/2015/11/everyday-dsp-for-programmers-dc-and.html
-  def __init__(sf,alpha=0.99):
+  # w[n] = x[n] + alpha*w[n-1] and y[n] = w[n] - w[n-1], with the states wn (w[n]) and wn1 (w[n-1]).
+  def __init__(sf,alpha=0.99,axis=0):
     sf.alpha = alpha
+    sf.axis = axis
     sf.wn = 0
     sf.wn1 = 0
     
   def filter(sf,x):
-    sf.y = np.zeros(x.shape[0])
+    """
+      Filters the whole signal x, starting from zero states.
+    """
     sf.wn = 0
     sf.wn1 = 0
-    for k in range(x.shape[0]):
-      sf.wn1 = sf.wn
-      sf.wn = x[k] + sf.alpha * sf.wn1
-      sf.y[k] = sf.wn - sf.wn1
+    return sf.process(x)
+
+  def process(sf,chunk):
+    """
+      Filters a chunk of samples, starting from the states left by the previous chunk.
+    """
+    chunk = np.asarray(chunk)
+    axis = sf.axis
+    if chunk.shape[axis] == 0:  # Empty chunk: empty output, states untouched
+      sf.y = np.zeros(chunk.shape)
+      return sf.y
+    wprev = np.expand_dims(np.broadcast_to(sf.wn,np.delete(chunk.shape,axis)),axis).astype(float)
+    w,_ = signal.lfilter([1],[1,-sf.alpha],chunk,axis=axis,zi=sf.alpha * wprev)
+    sf.y = w - np.concatenate((wprev,np.delete(w,-1,axis=axis)),axis=axis)
+    sf.wn1 = np.take(np.concatenate((wprev,w),axis=axis),-2,axis=axis)
+    sf.wn = np.take(w,-1,axis=axis)
     return sf.y
 
 
@@ -93,16 +237,23 @@ def NLargestPeaks(n,freq,mag,distance=20):
   return {'freqs':freqpks, 'mags': magpks}
 
 
-def freqAnalysis(signal,axis,fs=250,removeDC=True,labelsize=8,npeaks=3,peakdistance=50):
+def freqAnalysis(signal,axis,fs=250,removeDC=True,labelsize=8,npeaks=3,peakdistance=50,
+                 window=None,nperseg=None,N=None):
+  """
+    Plots the spectrum of signal (vector or samples x channels array) in axis, marking the npeaks largest peaks
+    of each channel. window, nperseg and N are passed to spectrum().
+  """
   if removeDC:
-    mag,freq = easyFourier(signal - np.mean(signal),fs=fs)
-  else:
-    mag,freq = easyFourier(signal,fs=fs)
+    signal = signal - np.mean(signal,axis=0)
+  mag,freq = spectrum(signal,fs=fs,window=window,nperseg=nperseg,N=N)
+  mag = mag.reshape(mag.shape[0],-1)
+  freq = np.broadcast_to(freq.reshape(freq.shape[0],-1),mag.shape)
 
-  axis.plot(freq,mag)
-  # axis.set_ylim(-100,20)
+  for ch in range(mag.shape[1]):
+    axis.plot(freq[:,ch],mag[:,ch])
+    # axis.set_ylim(-100,20)
+    pks = NLargestPeaks(npeaks,freq[:,ch],mag[:,ch],distance=peakdistance)
+    axis.plot(pks['freqs'],pks['mags'],"xr")
+    for f,m in zip(pks['freqs'],pks['mags']):
+      axis.text(f,m,f" {f:.2f} Hz",fontsize=7)
   axis.tick_params(labelsize=labelsize)
-  pks = NLargestPeaks(npeaks,freq,mag,distance=peakdistance)
-  axis.plot(pks['freqs'],pks['mags'],"xr")
-  for f,m in zip(pks['freqs'],pks['mags']):
-    axis.text(f,m,f" {f:.2f} Hz",fontsize=7)
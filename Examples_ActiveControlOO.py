@@ -3,10 +3,11 @@ import numpy as np
 import plotly.express as px
 import plotly.graph_objects as go
 
-from CantileverBeam import CantileverBeam
-from Filters import FIR
-from Adaptive import FIRNLMS
-from AdaptiveOO import FIRFxNLMS, FIR
+from ActVibModules.CantileverBeam import CantileverBeam
+from ActVibModules.Filters import FIR
+from ActVibModules.Utils import ClosedLoopSimulator
+from ActVibModules.Adaptive import FIRNLMS
+from ActVibModules.AdaptiveOO import FIRFxNLMS, FIR
 
 
 # %%
@@ -74,11 +75,9 @@ xh[0:int(fs*vibstart)] = 0.0 # Force set to zero for the first 10 seconds
 
 cbeam.reset()
 err = np.zeros(nsteps) # Vibration response
-# Running simulation:
-for k in range(nsteps):
-  err[k] = cbeam.getaccelms2(referencepos)  
-  cbeam.setforce(perturbpos,xh[k]) 
-  cbeam.update() # Updata for 1 sampling period.
+# Running simulation (acceleration is read before each update, hence the one sample shift):
+_, _, acc, _ = cbeam.update_block(xh, perturbpos, referencepos)
+err[1:] = acc[:-1]
 
 # Plotting the results:
 fig = px.line()
@@ -99,25 +98,16 @@ nsteps = int(maxtime * fs)
 firnlms = FIRNLMS(memorysize=firmem,stepsize=0.15,regularization=1e-3) # Create the FIRNLMS object
 
 # Secondary path via impulse response (ideal but not practical):
-wsecimpulse = np.zeros(firmem) # Impulse response vector
+impulse = np.zeros(firmem) # Force is applied at the control position only at the first sample
+impulse[0] = 1.0
 cbeam.reset()
-cbeam.setforce(controlpos,1.0) # Force is applied at the control position
-cbeam.update()
-wsecimpulse[0] = cbeam.getaccelms2(errorpos) # Read the acceleration at the error position
-cbeam.setforce(controlpos,0.0) # Force is removed
-for k in range(1,firmem):
-  cbeam.update() # Update the beam for 1 sampling period.
-  wsecimpulse[k] = cbeam.getaccelms2(errorpos) # Read the acceleration at the error position
+_, _, wsecimpulse, _ = cbeam.update_block(impulse, controlpos, errorpos) # Read the acceleration at the error position
 
 
 # Secondary path via adaptive modeling (the practical way):
 cbeam.reset()
 xrandom = np.random.randn(nsteps) # Random force vector
-yerror = np.zeros(nsteps) # Error signal vector
-for k in range(nsteps):
-  cbeam.setforce(controlpos,xrandom[k]) # Force is applied at the control position
-  cbeam.update() # Update the beam for 1 sampling period.
-  yerror[k] = cbeam.getaccelms2(errorpos) # Read the acceleration at the error position
+_, _, yerror, _ = cbeam.update_block(xrandom, controlpos, errorpos) # Acceleration at the error position
 
 firnlms.run(insignal=xrandom,outsignal=yerror,maxiter=nsteps) # Run the FIRNLMS algorithm
 wsecadaptive = firnlms.ww # Adaptive model of the secondary path
@@ -131,25 +121,16 @@ fig.show() # Plot the secondary path coefficients
 
 # %% Feedback path via impulse response (ideal but not practical):
 
-wfbkimpulse = np.zeros(firmem) # Impulse response vector
+impulse = np.zeros(firmem) # Force is applied at the control position only at the first sample
+impulse[0] = 1.0
 cbeam.reset()
-cbeam.setforce(controlpos,1.0) # Force is applied at the control position
-cbeam.update()
-wfbkimpulse[0] = cbeam.getaccelms2(referencepos) # Read the acceleration at the error position
-cbeam.setforce(controlpos,0.0) # Force is removed
-for k in range(1,firmem):
-  cbeam.update() # Update the beam for 1 sampling period.
-  wfbkimpulse[k] = cbeam.getaccelms2(referencepos) # Read the acceleration at the error position
+_, _, wfbkimpulse, _ = cbeam.update_block(impulse, controlpos, referencepos) # Read the acceleration at the reference position
 
 
 # Secondary path via adaptive modeling (the practical way):
 cbeam.reset()
 xrandom = np.random.randn(nsteps) # Random force vector
-yerror = np.zeros(nsteps) # Error signal vector
-for k in range(nsteps):
-  cbeam.setforce(controlpos,xrandom[k]) # Force is applied at the control position
-  cbeam.update() # Update the beam for 1 sampling period.
-  yerror[k] = cbeam.getaccelms2(referencepos) # Read the acceleration at the error position
+_, _, yerror, _ = cbeam.update_block(xrandom, controlpos, referencepos) # Acceleration at the reference position
 
 firnlms.run(insignal=xrandom,outsignal=yerror,maxiter=nsteps) # Run the FIRNLMS algorithm
 wfbkadaptive = firnlms.ww # Adaptive model of the secondary path
@@ -187,23 +168,17 @@ th = np.linspace(0.0,maxtime,nsteps) # Time vector
 xh = 0.3*np.sin(2*np.pi*th*vibfreq) # Sinusoidal force vector
 xh[0:int(fs*vibstart)] = 0.0 # Force is zero for the first 10 seconds
 
-cbeam.reset()
-err = np.zeros(nsteps) # Vibration response
-yfbk = np.zeros(nsteps) # Vibration response
-
-# Running the simulation:
-for k in range(nsteps):
-  cbeam.setforce(perturbpos,xh[k]) # force is applied
-  cbeam.setforce(controlpos,-controller.y) # Control force is applied
-
-  if th[k] >= controlstart: # Control starts at 30 seconds
-    controller.update(cbeam.getaccelms2(errorpos)) 
-  yfbk[k] = feedbackfilter.filterstep(-controller.y) # Get the feedback force
-  controller.evalout(cbeam.getaccelms2(referencepos) - yfbk[k])
-
-  err[k] = cbeam.getaccelms2(errorpos) # Error acceleration is read
-
-  cbeam.update() # beam is updated
+# Running the simulation. At each sample, the perturbation and control forces are applied,
+# the controller is adapted (after controlstart) with the error acceleration, the feedback
+# path estimate is removed from the reference acceleration, the controller output is
+# evaluated and the beam is updated:
+simulator = ClosedLoopSimulator(cbeam, controller, feedbackfilter,
+                                perturbpos, referencepos, controlpos, errorpos,
+                                log=('err', 'fbk'))
+results = simulator.run(xh, controlstart, t=th) # Beam, controller and feedback filter are reset
+err = results['err'] # Error acceleration
+yfbk = results['fbk'] # Feedback path estimate
+print(f"Simulation speed: {simulator.samplespersecond:.0f} samples/s")
 
 # Plotting the results:
 fig = px.line()
@@ -1,25 +1,109 @@
 import numpy as np
+from scipy import signal
+
+class DelayLine:
+    """
+    Delay line with the last N samples (newest first), implemented as a double-length
+    circular buffer: each sample is written twice, so the last N samples are always
+    available as a contiguous view (x) without shifting the buffer.
+    If trackenergy, the energy of the stored samples (x @ x) is tracked recursively in
+    energy. It is recomputed from scratch every resync pushes, and whenever it falls
+    below rtol times its largest value since the last recomputation (e.g. after a large
+    drop of amplitude, when the recursion loses its relative accuracy), so it never
+    drifts far or becomes negative.
+    """
+    rtol = 1e-6
+
+    def __init__(self, N, resync=1000, trackenergy=False):
+        self.N = N
+        self.resync = resync
+        self.trackenergy = trackenergy
+        self.reset()
+
+    def reset(self):
+        self.buffer = np.zeros(2 * self.N)
+        self.idx = 0
+        self.x = self.buffer[0:self.N]
+        self.energy = 0.0
+        self.peak = 0.0
+        self.count = 0
+
+    def push(self, xsample):
+        """
+        Inserts a new sample and returns the view with the last N samples (newest first).
+        """
+        self.idx = (self.idx - 1) % self.N
+        oldest = self.buffer[self.idx]
+        self.buffer[self.idx] = xsample
+        self.buffer[self.idx + self.N] = xsample
+        self.x = self.buffer[self.idx:self.idx + self.N]
+        if self.trackenergy:
+            self.count += 1
+            self.energy += xsample * xsample - oldest * oldest
+            if self.energy > self.peak:
+                self.peak = self.energy
+            if (self.count >= self.resync) or (self.energy < self.rtol * self.peak):
+                self.resyncenergy()
+        return self.x
+
+    def resyncenergy(self):
+        self.energy = self.x @ self.x
+        self.peak = self.energy
+        self.count = 0
+
+    def pushblock(self, xblock):
+        """
+        Inserts a block of samples (oldest first) and returns the view with the last N samples.
+        """
+        last = np.concatenate((xblock[::-1][0:self.N], self.x[0:max(self.N - xblock.shape[0], 0)]))
+        self.idx = 0
+        self.buffer[0:self.N] = last
+        self.buffer[self.N:] = last
+        self.x = self.buffer[0:self.N]
+        if self.trackenergy:
+            self.resyncenergy()
+        return self.x
+
 
 class FIR:
     """
     FIR filter class.
     """
+    directmaxlen = 64 # Block or filter lengths up to this value use direct convolution in filter_block
     def __init__(self, coeffs):
         self.w = coeffs
-        self.x = np.zeros(coeffs.shape[0])
         self.N = coeffs.shape[0]
-    
+        self.delayline = DelayLine(self.N)
+        self.x = self.delayline.x
+
     def reset(self):
-        self.x = np.zeros(self.N)
-    
+        self.delayline.reset()
+        self.x = self.delayline.x
+
     def filterstep(self, xsample):
-        self.x[1:] = self.x[:-1]
-        self.x[0] = xsample
+        self.x = self.delayline.push(xsample)
         ysample = self.w @ self.x
         return ysample
 
     def filter(self, x):
-        y = np.zeros(x.shape)
-        for k in range(x.shape[0]):
-            y[k] = self.filterstep(x[k])
-        return y
\ No newline at end of file
+        """
+        Filters the whole signal x, starting from (and updating) the current delay-line state.
+        """
+        return self.filter_block(x)
+
+    def filter_block(self, chunk):
+        """
+        Filters a block of samples carrying the state across calls, so that consecutive
+        blocks (or filterstep calls) give the same output as filtering the whole signal.
+        Short blocks or filters use direct convolution; otherwise, FFT overlap-add.
+        """
+        chunk = np.asarray(chunk)
+        if chunk.shape[0] == 0:
+            return np.empty(0)
+        xs = np.concatenate((self.x[0:self.N - 1][::-1], chunk))
+        if min(self.N, chunk.shape[0]) <= self.directmaxlen:
+            y = np.convolve(xs, self.w, mode='valid')
+        else:
+            y = signal.oaconvolve(xs, self.w, mode='valid')
+        self.x = self.delayline.pushblock(chunk)
+        return y
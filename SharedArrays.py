@@ -0,0 +1,97 @@
+'''
+    Sharing of read-only numpy arrays (modal matrices, path models, disturbance signals) with worker processes
+    through multiprocessing.shared_memory, so that workers build CantileverBeam (modes argument), FIR and
+    FIRFxNLMS (setSecondary) objects from zero-copy views instead of unpickling copies of the arrays.
+
+    Parent process:
+        with SharedArrays() as shared:
+            shared.publish('vmod',beam.vmod)
+            shared.publish('freqsHz',beam.freqsHz)
+            shared.publish('wsec',wsec)
+            ... submit tasks passing shared.handles() (small and picklable) ...
+        # Shared memory blocks are released at the end of the with block.
+
+    Worker process:
+        with SharedArrays.attach(handles) as shared:
+            beam = CantileverBeam(...,modes=(shared['vmod'],shared['freqsHz']))
+            ...
+'''
+
+import numpy as np
+from multiprocessing import shared_memory
+
+
+class SharedArrays:
+
+    '''
+        Set of named arrays in shared memory. The process that publishes the arrays owns the shared memory
+        blocks and releases them in close() (or at the end of a with block); attached instances only
+        detach from them.
+    '''
+    def __init__(self):
+        self.blocks = {}
+        self.arrays = {}
+        self.owner = True
+
+    def publish(self,name,array):
+        """
+            Copies array into a new shared memory block and returns the shared (read-only) view.
+        """
+        if name in self.arrays:
+            raise Exception(f"Array {name} already published.")
+        array = np.ascontiguousarray(array)
+        block = shared_memory.SharedMemory(create=True,size=max(array.nbytes,1))
+        view = np.ndarray(array.shape,dtype=array.dtype,buffer=block.buf)
+        view[...] = array
+        view.flags.writeable = False
+        self.blocks[name] = block
+        self.arrays[name] = view
+        return view
+
+    def handles(self):
+        """
+            Picklable description of the published arrays, to be passed to attach() in other processes.
+        """
+        return {name: (self.blocks[name].name,view.shape,view.dtype.str) for name,view in self.arrays.items()}
+
+    @classmethod
+    def attach(cls,handles):
+        """
+            Attaches to arrays published by another process (handles from handles()), as read-only views.
+        """
+        shared = cls()
+        shared.owner = False
+        for name,(blockname,shape,dtype) in handles.items():
+            block = shared_memory.SharedMemory(name=blockname)
+            view = np.ndarray(shape,dtype=np.dtype(dtype),buffer=block.buf)
+            view.flags.writeable = False
+            shared.blocks[name] = block
+            shared.arrays[name] = view
+        return shared
+
+    def __getitem__(self,name):
+        return self.arrays[name]
+
+    def __contains__(self,name):
+        return name in self.arrays
+
+    def close(self):
+        """
+            Detaches from the shared memory blocks and, in the owner process, releases them.
+            Views obtained from this object must not be used afterwards.
+        """
+        self.arrays.clear()
+        for block in self.blocks.values():
+            try:
+                block.close()
+            except BufferError:
+                pass  # Views still referenced elsewhere; the mapping is released when they are garbage collected.
+            if self.owner:
+                block.unlink()
+        self.blocks.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self,exc_type,exc_value,traceback):
+        self.close()
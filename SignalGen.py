@@ -1,23 +1,36 @@
+from functools import lru_cache
+
 import numpy as np
-from scipy.signal import butter, lfilter
+from scipy.signal import butter, sosfilt
 from scipy.fftpack import fft
 
 #class SignalGen:
 
 def sine(Npoints,freqHz,samplingT,Amplitude=1):
-    x = np.zeros(Npoints)
-    for k in range(0,Npoints):
-        x[k] = np.sin(2*np.pi*freqHz*k*samplingT)   
-    return x
+    return Amplitude * np.sin(2*np.pi*freqHz*np.arange(Npoints)*samplingT)
 
-def filteredNoise(Npoints,var,lowcut,highcut,samplingFreq,order=10):
-    xa = np.sqrt(var) * np.random.randn(Npoints)
+@lru_cache(maxsize=64)
+def bandpassSOS(order,lowcut,highcut,samplingFreq):
+    """
+    Butterworth band-pass design in second-order sections, cached by (order, lowcut, highcut, samplingFreq).
+    The returned array is shared among callers and must not be modified.
+    """
     nyq = 0.5 * samplingFreq
-    low = lowcut / nyq
-    high = highcut / nyq
-    b, a = butter(order, [low, high], btype='band')
-    x = lfilter(b, a, xa)
-    return x
+    sos = butter(order, [lowcut / nyq, highcut / nyq], btype='band', output='sos')
+    return sos
+
+def filteredNoise(Npoints,var,lowcut,highcut,samplingFreq,order=10,nrealizations=None):
+    """
+    White Gaussian noise with variance var filtered by a Butterworth band-pass filter (lowcut to highcut Hz).
+    With nrealizations, returns a (nrealizations x Npoints) array of independent realizations.
+    """
+    if nrealizations is None:
+        xa = np.sqrt(var) * np.random.randn(Npoints)
+    else:
+        # Drawn sample by sample (time-major), so that filteredNoiseBlocks() gives the same realizations.
+        xa = np.sqrt(var) * np.random.randn(Npoints,nrealizations).T
+    sos = bandpassSOS(order,float(lowcut),float(highcut),float(samplingFreq))
+    return sosfilt(sos, xa, axis=-1)
 
 def chirp(seconds,samplingfreq,freq,ampl=1,deltai=10,deltaf=10,tinicio=10,tfim=None):
     """
@@ -40,21 +53,109 @@ def chirp(seconds,samplingfreq,freq,ampl=1,deltai=10,deltaf=10,tinicio=10,tfim=N
     """    
     dt = 1/samplingfreq
     tt = np.arange(0,seconds,dt) # Vetor de tempo de 0 a Nseconds com passos de dt
-    out = np.zeros(tt.shape[0]) # Retorno
-    f = 0 # Freq. inicial = 0
-    integ = 0 # Integral, valor inicial
+    if tfim is None:
+        tfim = seconds
+    f,integ = rotationprofile(tt,dt,freq,deltai,deltaf,tinicio,tfim)
     cA = ampl/(freq**2) # Constante para amplitude ficar igual a "ampl" em regime
-    A = 0 # Amplitude inicial
+    return ((f**2) * cA) * np.sin(integ)
+
+
+def rotationprofile(tt,dt,freq,deltai,deltaf,tinicio,tfim,f0=0.0,integ0=0.0):
+    """
+    Frequency profile of a rotating machine (start at tinicio with a linear rise of deltai seconds up to freq,
+    steady state and linear fall of deltaf seconds from tfim on) and its phase (integral of 2*pi*f), for
+    the time vector tt with sampling period dt. f0 and integ0 are the frequency and phase at the sample
+    before tt[0], so that a profile can be evaluated block by block.
+
+    Returns:
+        (numpy.ndarray, numpy.ndarray): instantaneous frequency (Hz) and phase (rad) at each sample
+    """
+    f = np.full(tt.shape[0],np.nan) # NaN: frequency held from the previous sample (steady state)
+    off = (tt < tinicio) | (tt > (tfim+deltaf))
+    rise = ~off & (tt <= (tinicio+deltai))
+    fall = ~off & ~rise & (tt >= tfim) & (tt <= (tfim+deltaf))
+    f[off] = 0
+    f[rise] = freq * (tt[rise]-tinicio) / deltai
+    f[fall] = freq - freq * (tt[fall]-tfim) / deltaf
+    # Forward fill of the held samples (frequency starts at f0):
+    held = np.isnan(f)
+    lastset = np.maximum.accumulate(np.where(held,-1,np.arange(tt.shape[0])))
+    f = np.where(lastset >= 0,f[np.maximum(lastset,0)],f0)
+    integ = np.cumsum(np.concatenate(([integ0],2*np.pi*f*dt)))[1:]
+    return f,integ
+
+
+def rotatingmachine(seconds,samplingfreq,freq,harmonics=(1,2,3),amplitudes=(1,0.5,0.25),phases=None,
+                    deltai=10,deltaf=10,tinicio=10,tfim=None):
+    """
+    Generates a multi-harmonic signal of a rotating machine with the start, steady state and end of chirp(),
+    i.e., the sum of sinusoids at multiples (harmonics) of the rotation frequency, all following the same
+    frequency profile and with amplitudes proportional to the squared rotation frequency.
+
+    Args:
+        seconds (int): Total time of the signal
+        samplingfreq (int): Sampling frequency (Hz)
+        freq (float): Rotation frequency at steady state (Hz)
+        harmonics (sequence, optional): Harmonic numbers. Defaults to (1,2,3).
+        amplitudes (sequence, optional): Amplitude of each harmonic at steady state. Defaults to (1,0.5,0.25).
+        phases (sequence, optional): Phase of each harmonic (rad). Defaults to zeros.
+        deltai, deltaf, tinicio, tfim: As in chirp().
+
+    Returns:
+        numpy.ndarray: Generated signal
+    """
+    dt = 1/samplingfreq
+    tt = np.arange(0,seconds,dt)
     if tfim is None:
         tfim = seconds
-    for n,t in enumerate(tt): # Varia n de 0 ao número de elementos no vetor tt, e t = tt[n]
-        if (t < tinicio) or (t > (tfim+deltaf)):
-            f = 0             
-        elif t <= (tinicio+deltai):
-            f = freq * (t-tinicio) / deltai              
-        elif (t >= tfim) and (t <= (tfim+deltaf)):
-            f = freq - freq * (t-tfim) / deltaf               
-        A = (f**2) * cA
-        integ = integ + 2*np.pi*f*dt
-        out[n] = A * np.sin(integ)
-    return out
+    harmonics = np.asarray(harmonics,dtype=float)
+    amplitudes = np.broadcast_to(np.asarray(amplitudes,dtype=float),harmonics.shape)
+    phases = np.zeros(harmonics.shape) if phases is None else np.broadcast_to(np.asarray(phases,dtype=float),harmonics.shape)
+    f,integ = rotationprofile(tt,dt,freq,deltai,deltaf,tinicio,tfim)
+    scale = (f/freq)**2
+    return scale * (amplitudes @ np.sin(np.outer(harmonics,integ) + phases[:,np.newaxis]))
+
+
+# Streaming versions: generators of blocks of blocksize samples (the last one may be shorter when the
+# total length is given), with continuous phase and filter states across blocks, for simulations of
+# unbounded duration at constant memory. Concatenating the blocks gives the same signal as the
+# corresponding function above.
+
+def sineBlocks(blocksize,freqHz,samplingT,Amplitude=1,Npoints=None):
+    k0 = 0
+    while (Npoints is None) or (k0 < Npoints):
+        n = blocksize if Npoints is None else min(blocksize,Npoints-k0)
+        yield Amplitude * np.sin(2*np.pi*freqHz*np.arange(k0,k0+n)*samplingT)
+        k0 += n
+
+
+def filteredNoiseBlocks(blocksize,var,lowcut,highcut,samplingFreq,order=10,Npoints=None,nrealizations=None):
+    sos = bandpassSOS(order,float(lowcut),float(highcut),float(samplingFreq))
+    extra = () if nrealizations is None else (nrealizations,)
+    zi = np.zeros((sos.shape[0],) + extra + (2,)) # Filter state carried across blocks
+    k0 = 0
+    while (Npoints is None) or (k0 < Npoints):
+        n = blocksize if Npoints is None else min(blocksize,Npoints-k0)
+        x, zi = sosfilt(sos, np.sqrt(var) * np.random.randn(*((n,) + extra)).T, axis=-1, zi=zi)
+        yield x
+        k0 += n
+
+
+def chirpBlocks(blocksize,samplingfreq,freq,ampl=1,deltai=10,deltaf=10,tinicio=10,tfim=None,seconds=None):
+    """
+    Streaming version of chirp(). With seconds=None, blocks are generated indefinitely and, if tfim is
+    also None, the signal stays in steady state after the rise.
+    """
+    dt = 1/samplingfreq
+    Npoints = None if seconds is None else np.arange(0,seconds,dt).shape[0]
+    if tfim is None:
+        tfim = np.inf if seconds is None else seconds
+    cA = ampl/(freq**2)
+    f0, integ0 = 0.0, 0.0
+    k0 = 0
+    while (Npoints is None) or (k0 < Npoints):
+        n = blocksize if Npoints is None else min(blocksize,Npoints-k0)
+        f,integ = rotationprofile(np.arange(k0,k0+n)*dt,dt,freq,deltai,deltaf,tinicio,tfim,f0,integ0)
+        f0, integ0 = f[-1], integ[-1]
+        yield ((f**2) * cA) * np.sin(integ)
+        k0 += n
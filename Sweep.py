@@ -0,0 +1,281 @@
+'''
+    Parallel parameter sweeps of closed-loop active vibration control simulations.
+
+    A scenario is a dictionary with the keys of defaultscenario. A sweep runs one scenario per point of a
+    parameter space (list of dictionaries with the parameters that change, see gridspace() and randomspace())
+    over a process pool and collects summary metrics in a pandas DataFrame.
+'''
+
+import itertools
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+
+from .CantileverBeam import CantileverBeam
+from .Adaptive import FIRFxNLMS, LeakyFxNLMS, FDAFFxNLMS
+from .Filters import FIR
+from .Utils import ClosedLoopSimulator
+from .SharedArrays import SharedArrays
+from . import SignalGen
+
+defaultscenario = {
+    # Beam (fixed along a sweep, since the modal data and paths are shared among the runs):
+    'npoints': 100, 'width': 0.05, 'thickness': 0.006, 'length': 0.58, 'fs': 416.0,
+    'damp': (0.01, 0.01, 0.01, 0.01, 0.01),
+    'noisestd': 0.0,
+    # Positions of the perturbation force, reference sensor, control force and error sensor:
+    'perturbpos': 30, 'referencepos': 75, 'controlpos': 60, 'errorpos': 95,
+    # Controller ('FIRFxNLMS', 'LeakyFxNLMS' or 'FDAFFxNLMS'):
+    'controller': 'FIRFxNLMS', 'mem': 300, 'memsec': 1000, 'mu': 0.001, 'fi': 1e-3,
+    'leakfactor': 0.9999, 'blocksize': 64,
+    # Disturbance ('sine' or 'noise', the latter being band-limited noise between lowcut and highcut):
+    'disturbance': 'sine', 'vibfreq': 12.0, 'amplitude': 0.3, 'lowcut': 5.0, 'highcut': 40.0,
+    # Simulation and metrics:
+    'maxtime': 120.0, 'controlstart': 30.0, 'window': 10.0, 'margindB': 3.0,
+}
+
+# Parameters that define the modal data and the paths, which cannot change along a sweep:
+beamparams = ('npoints', 'width', 'thickness', 'length', 'fs', 'damp')
+
+metricnames = ('attenuationdB', 'steadystatedB', 'convergencetime', 'diverged', 'samplespersecond')
+
+
+def gridspace(**params):
+    """
+        Full grid of the given parameter values, e.g. gridspace(mu=[1e-3,1e-2],mem=[100,300]).
+        Returns a list of dictionaries.
+    """
+    names = list(params.keys())
+    return [dict(zip(names,values)) for values in itertools.product(*[params[name] for name in names])]
+
+
+def randomspace(nsamples,seed=None,**params):
+    """
+        nsamples random points of the parameter space. Each parameter is given as a list (uniformly
+        chosen values), a tuple (low, high) (uniform distribution) or a function of a numpy Generator.
+        Returns a list of dictionaries.
+    """
+    rng = np.random.default_rng(seed)
+    space = []
+    for _ in range(nsamples):
+        point = {}
+        for name,values in params.items():
+            if callable(values):
+                point[name] = values(rng)
+            elif isinstance(values,tuple):
+                point[name] = float(rng.uniform(values[0],values[1]))
+            else:
+                point[name] = values[rng.integers(len(values))]
+        space.append(point)
+    return space
+
+
+def runseed(seed,run):
+    # Independent seed for each run, reproducible regardless of the execution order.
+    return int(np.random.SeedSequence([seed,run]).generate_state(1)[0])
+
+
+def createbeam(scenario,modes=None):
+    return CantileverBeam(npoints=scenario['npoints'],width=scenario['width'],thickness=scenario['thickness'],
+                          length=scenario['length'],Tsampling=1.0/scenario['fs'],damp=list(scenario['damp']),
+                          noisestd=scenario['noisestd'],modes=modes)
+
+
+def createcontroller(scenario):
+    name = scenario['controller']
+    if name == 'FIRFxNLMS':
+        return FIRFxNLMS(scenario['mem'],scenario['memsec'])
+    elif name == 'LeakyFxNLMS':
+        return LeakyFxNLMS(scenario['mem'],scenario['memsec'],scenario['leakfactor'])
+    elif name == 'FDAFFxNLMS':
+        return FDAFFxNLMS(scenario['mem'],scenario['memsec'],blocksize=scenario['blocksize'])
+    raise Exception(f"Unknown controller: {name}.")
+
+
+def createdisturbance(scenario,nsteps):
+    if scenario['disturbance'] == 'sine':
+        return scenario['amplitude'] * SignalGen.sine(nsteps,scenario['vibfreq'],1.0/scenario['fs'])
+    elif scenario['disturbance'] == 'noise':
+        return SignalGen.filteredNoise(nsteps,scenario['amplitude']**2,scenario['lowcut'],scenario['highcut'],
+                                       scenario['fs'],order=4)
+    raise Exception(f"Unknown disturbance: {scenario['disturbance']}.")
+
+
+def errormetrics(err,fs,controlstart,window=10.0,margindB=3.0):
+    """
+        Summary metrics of the error signal of a run:
+            attenuationdB: error power before the control (window seconds before controlstart) over the
+                           error power in the last window seconds, in dB.
+            steadystatedB: error power in the last window seconds, in dB.
+            convergencetime: time after controlstart at which the error power (averaged over 1 s) gets
+                             to within margindB of the steady-state power for good.
+            diverged: True if the error is not finite.
+    """
+    nwin = int(window * fs)
+    kstart = int(np.ceil(controlstart * fs))
+    if not np.all(np.isfinite(err)):
+        return {'attenuationdB': np.nan, 'steadystatedB': np.nan, 'convergencetime': np.nan, 'diverged': True}
+    sspower = np.mean(err[-nwin:]**2) + 1e-30
+    prepower = np.mean(err[max(kstart-nwin,0):kstart]**2) if kstart > 0 else np.nan
+    nsmooth = int(fs)
+    smoothpower = np.convolve(err[kstart:]**2,np.ones(nsmooth)/nsmooth,mode='valid')
+    above = np.nonzero(smoothpower > sspower * 10**(margindB/10))[0]
+    # Index of the first 1 s window after the last one above the margin, converted to its end time:
+    convergencetime = ((above[-1] + 1) if above.size else 0) / fs + nsmooth / fs
+    return {'attenuationdB': 10*np.log10(prepower/sspower),
+            'steadystatedB': 10*np.log10(sspower),
+            'convergencetime': convergencetime,
+            'diverged': False}
+
+
+def runscenario(scenario,seed=None,wsec=None,wfbk=None,modes=None,perturbation=None):
+    """
+        Runs a single closed-loop simulation (the scenario is completed with defaultscenario) and returns
+        its metrics (see errormetrics()). Secondary (wsec) and feedback (wfbk) paths are evaluated in
+        closed form from the beam when not given. modes is passed to CantileverBeam and, when given,
+        perturbation replaces the disturbance of the scenario.
+    """
+    scenario = {**defaultscenario,**scenario}
+    if seed is not None:
+        np.random.seed(seed)
+    beam = createbeam(scenario,modes)
+    if wsec is None:
+        wsec = beam.impulseresponse(scenario['controlpos'],scenario['errorpos'],scenario['memsec'],'accel')
+    if wfbk is None:
+        wfbk = beam.impulseresponse(scenario['controlpos'],scenario['referencepos'],scenario['memsec'],'accel')
+    controller = createcontroller(scenario)
+    controller.setSecondary(wsec)
+    controller.setParams(scenario['mu'],scenario['fi'])
+    if perturbation is None:
+        perturbation = createdisturbance(scenario,int(scenario['maxtime'] * scenario['fs']))
+    simulator = ClosedLoopSimulator(beam,controller,FIR(wfbk),scenario['perturbpos'],scenario['referencepos'],
+                                    scenario['controlpos'],scenario['errorpos'],log=('err',),sparse=True)
+    with np.errstate(all='ignore'):
+        err = simulator.run(perturbation,scenario['controlstart'])['err']
+        metrics = errormetrics(err,scenario['fs'],scenario['controlstart'],scenario['window'],scenario['margindB'])
+    metrics['samplespersecond'] = simulator.samplespersecond
+    return metrics
+
+
+# Shared data of the worker processes (set by initworker()):
+workerdata = {}
+
+
+def initworker(scenario,handles,pathindex):
+    # Attached for the whole life of the worker; the parent process releases the shared memory.
+    workerdata.update(scenario=scenario,shared=SharedArrays.attach(handles),pathindex=pathindex)
+
+
+def runworker(run,seed,params):
+    scenario = {**workerdata['scenario'],**params}
+    shared,pathindex = workerdata['shared'],workerdata['pathindex']
+    paths = shared['paths']
+    # Paths are computed with the longest memsec of the sweep; each run uses their first memsec samples.
+    wsec = paths[pathindex[(scenario['controlpos'],scenario['errorpos'])],0:scenario['memsec']]
+    wfbk = paths[pathindex[(scenario['controlpos'],scenario['referencepos'])],0:scenario['memsec']]
+    perturbation = shared['perturbation'] if 'perturbation' in shared else None
+    return run,runscenario(scenario,seed,wsec,wfbk,(shared['vmod'],shared['freqsHz']),perturbation)
+
+
+class ParameterSweep:
+
+    '''
+        Parallel sweep of closed-loop simulations.
+        scenario: base scenario (missing keys are taken from defaultscenario)
+        space: list of dictionaries with the parameters of each run (see gridspace() and randomspace())
+        seed: base seed; each run gets its own seed derived from it and the run number
+        checkpoint: file (.csv) where results are saved along the sweep; an existing checkpoint is
+                    loaded and its runs are skipped, so that an interrupted sweep can be resumed
+        maxworkers: number of worker processes (os.cpu_count() by default)
+        perturbation: optional perturbation force vector used in all runs instead of the disturbance of
+                      the scenarios (shared with the workers without copies)
+    '''
+    def __init__(self,scenario,space,seed=0,checkpoint=None,maxworkers=None,checkpointevery=10,perturbation=None):
+        self.scenario = {**defaultscenario,**scenario}
+        for params in space:
+            for name in params:
+                if name in beamparams:
+                    raise Exception(f"Parameter {name} cannot change along a sweep.")
+                if name not in defaultscenario:
+                    raise Exception(f"Unknown parameter: {name}.")
+        self.space = space
+        self.seed = seed
+        self.checkpoint = checkpoint
+        self.maxworkers = maxworkers
+        self.checkpointevery = checkpointevery
+        self.perturbation = perturbation
+        self.results = None
+
+    def runsframe(self):
+        rows = []
+        for run,params in enumerate(self.space):
+            rows.append({'run': run,'seed': runseed(self.seed,run),**params})
+        return pd.DataFrame(rows).set_index('run')
+
+    def loadcheckpoint(self,frame):
+        if (self.checkpoint is None) or (not os.path.isfile(self.checkpoint)):
+            return frame
+        saved = pd.read_csv(self.checkpoint,index_col='run')
+        common = saved.index.intersection(frame.index)
+        if not saved.loc[common,'seed'].equals(frame.loc[common,'seed']):
+            raise Exception("Checkpoint does not match this sweep (different seeds).")
+        for name in metricnames:
+            frame.loc[common,name] = saved.loc[common,name]
+        return frame
+
+    def savecheckpoint(self,frame):
+        if self.checkpoint is None:
+            return
+        tmpname = f"{self.checkpoint}.{os.getpid()}.tmp"  # Atomic write
+        frame.to_csv(tmpname)
+        os.replace(tmpname,self.checkpoint)
+
+    def paths(self,beam):
+        # Impulse responses of all (control position, sensor position) pairs used along the sweep, with
+        # the longest memsec of the sweep.
+        pairs = set()
+        memsec = self.scenario['memsec']
+        for params in self.space:
+            scenario = {**self.scenario,**params}
+            pairs.add((scenario['controlpos'],scenario['errorpos']))
+            pairs.add((scenario['controlpos'],scenario['referencepos']))
+            memsec = max(memsec,scenario['memsec'])
+        pathindex = {pair: k for k,pair in enumerate(sorted(pairs))}
+        paths = np.zeros((len(pathindex),memsec))
+        for (cpos,spos),k in pathindex.items():
+            paths[k] = beam.impulseresponse(cpos,spos,memsec,'accel')
+        return paths,pathindex
+
+    def run(self):
+        """
+            Runs the pending runs and returns a DataFrame with one row per run (parameters, seed and metrics).
+        """
+        frame = self.runsframe()
+        for name in metricnames:
+            frame[name] = np.nan
+        frame['diverged'] = frame['diverged'].astype(object)
+        frame = self.loadcheckpoint(frame)
+        pending = frame.index[frame['diverged'].isna()].tolist()
+        if pending:
+            beam = createbeam(self.scenario)
+            paths,pathindex = self.paths(beam)
+            with SharedArrays() as shared:
+                shared.publish('vmod',beam.vmod)
+                shared.publish('freqsHz',beam.freqsHz)
+                shared.publish('paths',paths)
+                if self.perturbation is not None:
+                    shared.publish('perturbation',self.perturbation)
+                initargs = (self.scenario,shared.handles(),pathindex)
+                with ProcessPoolExecutor(max_workers=self.maxworkers,initializer=initworker,initargs=initargs) as pool:
+                    futures = [pool.submit(runworker,run,int(frame.loc[run,'seed']),self.space[run]) for run in pending]
+                    for ndone,future in enumerate(as_completed(futures),start=1):
+                        run,metrics = future.result()
+                        for name,value in metrics.items():
+                            frame.loc[run,name] = value
+                        if ndone % self.checkpointevery == 0:
+                            self.savecheckpoint(frame)
+            self.savecheckpoint(frame)
+        self.results = frame
+        return frame
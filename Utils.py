@@ -1,5 +1,7 @@
+import time
 import numpy as np
 from .CantileverBeam import CantileverBeam
+from .Filters import FIR, DelayLine
 
 class PathModeling:
 
@@ -7,8 +9,10 @@ class PathModeling:
         Modelling of paths on a given beam
         cbeam: the beam under simulation (of type CantileverBeam)
         N: memory size of the obtained models
-        type: 0 for ideal modeling using the impulse response and
-              1 for adaptive modeling using the NLMS algorithm with 0.25 as step size and 1e-3 as normalization factor.
+        type: 0 for ideal modeling using the impulse response,
+              1 for adaptive modeling using the NLMS algorithm with 0.25 as step size and 1e-3 as normalization factor and
+              2 for ideal modeling with the impulse response evaluated in closed form from the modal parameters
+                (same result as type 0, without noise, but no time-stepping).
         simtime: simulation time for type = 1 (adaptive modeling)
         mode: 0 for accelearation (accelerometer)
               1 for rotation velocity (gyroscope)
@@ -20,16 +24,22 @@ class PathModeling:
         self.simtime = simtime
         if mode == 0:
             self.movefunc = self.beam.getaccelms2
+            self.output = 'accel'
         elif mode == 1:
             self.movefunc = self.beam.getrotationvel
+            self.output = 'rotvel'
 
     '''
         pinput: position for force application
         poutput: position for accelaration (m/s^2) reading         
     '''
     def runModelling(self,pinput,poutput):
-        self.beam.reset()
         N = self.N
+        if self.type == 2:
+            # Force of 10 at the first sample, as in type 0.
+            return 10 * self.beam.impulseresponse(pinput,poutput,N,self.output)
+
+        self.beam.reset()
         ww = np.zeros(N)
 
         if self.type == 0:
@@ -44,13 +54,146 @@ class PathModeling:
         else:
             NN = self.simtime * int(np.round(1/self.beam.Ts))
             x = np.random.rand(NN)*4-2
-            xx = np.zeros(N)
+            xxline = DelayLine(N)
             for n in range(0,NN):
-                xx[1:] = xx[:-1]
-                xx[0] = x[n]
+                xx = xxline.push(x[n])
                 self.beam.setforce(pinput,x[n])
                 self.beam.update()
                 e = self.movefunc(poutput) - ww @ xx
                 ww = ww + 0.25 * e * xx / (xx.T @ xx + 1e-3) 
 
-        return ww 
\ No newline at end of file
+        return ww 
+
+    '''
+        Impulse responses (unit force) of all pairs of force positions (pinputs) and sensor positions (poutputs),
+        evaluated in closed form. Returns an array (len(pinputs) x len(poutputs) x N).
+    '''
+    def impulseResponses(self,pinputs,poutputs):
+        return self.beam.impulseresponse(pinputs,poutputs,self.N,self.output)
+
+    '''
+        Complex frequency responses of all pairs of force positions (pinputs) and sensor positions (poutputs)
+        at the frequencies in freqs (Hz), evaluated in closed form. Returns an array (len(pinputs) x len(poutputs) x len(freqs)).
+    '''
+    def frequencyResponses(self,pinputs,poutputs,freqs):
+        return self.beam.freqresponse(pinputs,poutputs,freqs,self.output)
+
+
+class ClosedLoopSimulator:
+
+    '''
+        Closed-loop simulation of active vibration control (feedforward control with feedback neutralization) on a beam.
+        cbeam: the beam under simulation (of type CantileverBeam)
+        controller: the adaptive controller (FIRFxNLMS, LeakyFxNLMS or FDAFFxNLMS from Adaptive, or FIRFxNLMS from AdaptiveOO),
+                    with its secondary path already set
+        feedbackfilter: FIR model of the feedback path (from the control force to the reference sensor), or None
+        perturbpos, referencepos, controlpos, errorpos: positions of the perturbation force, reference sensor,
+                    control force and error sensor
+        log: signals to be logged, among 'perturb' (perturbation force), 'ctrl' (control force), 'ref' (reference
+             acceleration), 'fbk' (feedback path estimate) and 'err' (error acceleration)
+        decimation: only one of every decimation samples is logged
+        sparse: if True, the beam is set to the sparse-output mode (observing only the sensor positions) during the run
+    '''
+    signalnames = ('perturb','ctrl','ref','fbk','err')
+
+    def __init__(self,cbeam: CantileverBeam,controller,feedbackfilter: FIR,perturbpos,referencepos,controlpos,errorpos,
+                 log=('err',),decimation=1,sparse=False):
+        for name in log:
+            if name not in self.signalnames:
+                raise Exception(f"Unknown signal: {name}. Options are {', '.join(self.signalnames)}.")
+        self.beam = cbeam
+        self.controller = controller
+        self.feedbackfilter = feedbackfilter
+        self.perturbpos = perturbpos
+        self.referencepos = referencepos
+        self.controlpos = controlpos
+        self.errorpos = errorpos
+        self.log = tuple(log)
+        self.decimation = decimation
+        self.sparse = sparse
+        self.elapsed = 0.0
+        self.samplespersecond = 0.0
+
+    '''
+        Runs the simulation for the perturbation force vector (one sample per beam step), with the controller
+        adaptation enabled from controlstart (s) on. The control starts at the first sample where t >= controlstart,
+        where t is the time vector of the perturbation (k*Ts by default).
+        If reset is True, the beam, the controller and the feedback filter are reset before the run.
+        Returns a dictionary with the time vector ('t') and the logged signals, and stores the elapsed
+        time (elapsed) and simulation speed (samplespersecond).
+    '''
+    def run(self,perturbation,controlstart=0.0,t=None,reset=True):
+        beam = self.beam
+        nsteps = perturbation.shape[0]
+        if t is None:
+            t = np.arange(nsteps) * beam.Ts
+        kstart = np.searchsorted(t,controlstart)
+        if reset:
+            beam.reset()
+            self.controller.reset()
+            if self.feedbackfilter is not None:
+                self.feedbackfilter.reset()
+        setsparse = self.sparse and (beam.observedpos is None)
+        if setsparse:
+            beam.observe([self.referencepos,self.errorpos],[self.perturbpos,self.controlpos])
+
+        dec = self.decimation
+        logbuf = np.zeros(((nsteps + dec - 1) // dec,len(self.signalnames)))
+
+        # Attribute lookups hoisted out of the loop:
+        controller = self.controller
+        setforce = beam.setforce
+        getaccel = beam.getaccelms2
+        beamupdate = beam.update
+        ctrlupdate = controller.update
+        evalout = controller.evalout
+        fbkstep = self.feedbackfilter.filterstep if self.feedbackfilter is not None else None
+        perturbpos, referencepos = self.perturbpos, self.referencepos
+        controlpos, errorpos = self.controlpos, self.errorpos
+        xh = np.asarray(perturbation,dtype=float).tolist()
+
+        tstart = time.perf_counter()
+        yfbk = 0.0
+        for k in range(nsteps):
+            xk = xh[k]
+            ctrl = -controller.y
+            setforce(perturbpos,xk)
+            setforce(controlpos,ctrl)
+            if k >= kstart:
+                ctrlupdate(getaccel(errorpos))
+            if fbkstep is not None:
+                yfbk = fbkstep(-controller.y)
+            ref = getaccel(referencepos)
+            evalout(ref - yfbk)
+            err = getaccel(errorpos)
+            if k % dec == 0:
+                logbuf[k // dec] = (xk,ctrl,ref,yfbk,err)
+            beamupdate()
+        self.elapsed = time.perf_counter() - tstart
+        self.samplespersecond = nsteps / self.elapsed if self.elapsed > 0 else np.inf
+
+        if setsparse:
+            beam.observe(None)
+        results = {'t': np.asarray(t)[::dec]}
+        for name in self.log:
+            results[name] = logbuf[:,self.signalnames.index(name)].copy()
+        return results
+
+    '''
+        Runs the simulation consuming the perturbation block by block (e.g. from the block generators of
+        SignalGen), at constant memory, and yields the results of each block (as in run(), with the time
+        vector continuing across blocks). Blocks should have a multiple of decimation samples.
+        The whole run stores the elapsed time (elapsed) and simulation speed (samplespersecond).
+    '''
+    def runblocks(self,blocks,controlstart=0.0,reset=True):
+        k0 = 0
+        elapsed = 0.0
+        for block in blocks:
+            nsteps = np.shape(block)[0]
+            t = np.arange(k0,k0+nsteps) * self.beam.Ts
+            results = self.run(block,controlstart,t=t,reset=(reset and (k0 == 0)))
+            k0 += nsteps
+            elapsed += self.elapsed
+            self.elapsed = elapsed
+            self.samplespersecond = k0 / elapsed if elapsed > 0 else np.inf
+            yield results
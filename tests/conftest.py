@@ -0,0 +1,16 @@
+'''
+    The modules live at the root of the project but are imported as ActVibModules.<module> (see pyproject.toml).
+    When the package is not installed, register the project root as the ActVibModules package.
+'''
+
+import importlib.util
+import os
+import sys
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+if importlib.util.find_spec("ActVibModules") is None:
+    spec = importlib.util.spec_from_file_location("ActVibModules",os.path.join(root,"__init__.py"),
+                                                  submodule_search_locations=[root])
+    package = importlib.util.module_from_spec(spec)
+    sys.modules["ActVibModules"] = package
@@ -0,0 +1,79 @@
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+import pytest
+
+from ActVibModules.ActVibSystem import ActVibData, MeasurementCatalog
+
+
+def writefeather(filename,nrows=1000,batchrows=128):
+    # Feather (Arrow IPC) file with several small record batches.
+    time = np.arange(nrows) * 4e-3
+    accx = np.sin(2 * np.pi * 5 * time)
+    table = pa.table({"time": time,"imu1accx": accx})
+    with pa.ipc.new_file(str(filename),table.schema) as writer:
+        for batch in table.to_batches(max_chunksize=batchrows):
+            writer.write_batch(batch)
+    return time,accx
+
+
+def test_window_across_feather_batches(tmp_path):
+    filename = tmp_path / "batches.feather"
+    time,accx = writefeather(filename)
+    data = ActVibData(filename)
+    assert data.source.num_record_batches > 1
+    t0,t1 = time[100],time[300]  # Rows 100 to 300 span the batches starting at rows 128 and 256
+    window = data.window(t0,t1,columns=["imu1accx"],asarrays=True)
+    np.testing.assert_array_equal(window["imu1accx"],accx[100:301])
+    np.testing.assert_array_equal(data.readrows("imu1accx",120,130),accx[120:130])
+
+
+def test_full_dataframe_by_default(tmp_path):
+    filename = tmp_path / "batches.feather"
+    time,accx = writefeather(filename)
+    data = ActVibData(filename)
+    assert list(data.columns) == ["time","imu1accx"]
+    assert data.head().shape == (5,2)
+    np.testing.assert_array_equal(data.getTime(),time)
+    np.testing.assert_array_equal(data.time.values,time)
+
+
+def test_lazy_columns(tmp_path):
+    filename = tmp_path / "batches.feather"
+    time,accx = writefeather(filename)
+    data = ActVibData(filename,lazy=True)
+    assert len(data.columns) == 0
+    np.testing.assert_array_equal(data.time.values,time)
+    np.testing.assert_array_equal(data.getAccX(),accx)
+    assert list(data.columns) == ["time","imu1accx"]
+
+
+@pytest.mark.filterwarnings("ignore::DeprecationWarning")  # Feather V1 is deprecated by pyarrow
+def test_feather_v1(tmp_path):
+    time = np.arange(100) * 4e-3
+    accx = np.sin(2 * np.pi * 5 * time)
+    filename = tmp_path / "v1.feather"
+    feather.write_feather(pd.DataFrame({"Tempo (s)": time,"IMU1AccX": accx}),str(filename),version=1)
+    data = ActVibData(filename,lazy=True)  # Loaded at once
+    assert list(data.columns) == ["time","imu1accx"]
+    np.testing.assert_array_equal(data.getTime(),time)
+    np.testing.assert_array_equal(data.getAccX(),accx)
+    np.testing.assert_array_equal(data.window(time[10],time[20],asarrays=True)["imu1accx"],accx[10:21])
+    data.close()
+    catalog = MeasurementCatalog(tmp_path)
+    assert list(catalog.index["nrows"]) == [100]
+    np.testing.assert_array_equal(catalog.load("imu1accx")[str(filename)],accx)
+
+
+def test_catalog_keeps_few_files_open(tmp_path):
+    for k in range(5):
+        writefeather(tmp_path / f"m{k}.feather",nrows=100+k)
+    catalog = MeasurementCatalog(tmp_path,maxfiles=2)
+    assert len(catalog.index) == 5
+    assert list(catalog.index["nrows"]) == [100,101,102,103,104]
+    assert len(catalog.files) == 0  # Files are closed after scanning
+    accx = catalog.load("imu1accx")
+    assert len(catalog.files) == 2
+    for filename in catalog.index.index:
+        np.testing.assert_array_equal(accx[filename],ActVibData(filename).getAccX())
@@ -0,0 +1,84 @@
+import numpy as np
+import pytest
+
+from ActVibModules.Adaptive import FIRNLMS, FIRFxNLMS, FDAFFxNLMS
+from ActVibModules.CantileverBeam import CantileverBeam
+from ActVibModules.Filters import FIR
+from ActVibModules.Utils import ClosedLoopSimulator
+
+wsec = np.r_[0,0,0.8,0.5,-0.3,0.1,np.zeros(26)]  # Secondary path
+wpri = np.r_[0,0.3,1.0,0.6,-0.2,0.1,0.05,np.zeros(25)]  # Primary path
+
+
+def runcontrol(controller,x,d):
+    # Feedforward control loop: e = d - (secondary path * controller output).
+    secondary = FIR(wsec)
+    e = np.zeros(x.shape[0])
+    for n in range(x.shape[0]):
+        controller.evalout(x[n])
+        e[n] = d[n] - secondary.filterstep(controller.y)
+        controller.update(e[n])
+    return e
+
+
+@pytest.mark.parametrize("method,blocksize",[("nlms",None),("blocknlms",None),("blocknlms",50),("blocknlms",2000),
+                                             ("wiener",None)])
+def test_firnlms_identifies_fir(method,blocksize):
+    # Identification of a known FIR filter (memorysize 200) from white noise, without measurement noise.
+    rng = np.random.default_rng(0)
+    w = rng.standard_normal(200) * np.exp(-np.arange(200)/30)
+    x = rng.standard_normal(40000)
+    d = np.convolve(x,w)[0:x.shape[0]]
+    identifier = FIRNLMS(memorysize=200,stepsize=0.5,wwavgwindow=1000)
+    identifier.run(x,d,method=method,blocksize=blocksize)
+    tol = 1e-2 if method == "wiener" else 1e-4  # The Wiener solution uses biased correlation estimates
+    np.testing.assert_allclose(identifier.ww,w,rtol=0,atol=tol)
+    np.testing.assert_allclose(identifier.wwavg,w,rtol=0,atol=tol)
+    assert identifier.sqerror.shape == x.shape
+    assert np.mean(identifier.sqerror[-1000:]) < 1e-4 * np.mean(d**2)
+    if method == "wiener":
+        np.testing.assert_allclose(identifier.sqerror,(d - np.convolve(x,identifier.ww)[0:x.shape[0]])**2,atol=1e-12)
+    else:
+        assert np.mean(identifier.sqerror[0:100]) > 0.1 * np.mean(d**2)  # Error of the initial (zero) filter
+
+
+@pytest.mark.parametrize("reference",["narrowband","white"])
+def test_fdaf_converges_as_nlms(reference):
+    # With the same mu, both controllers get to similar steady-state errors.
+    rng = np.random.default_rng(0)
+    N = 30000
+    if reference == "narrowband":
+        x = np.sin(2*np.pi*0.037*np.arange(N)) + 0.01*rng.standard_normal(N)
+    else:
+        x = rng.standard_normal(N)
+    d = np.convolve(x,wpri)[0:N] + 0.01*rng.standard_normal(N)
+    powers = {}
+    for name,controller in [("nlms",FIRFxNLMS(128,32)),("fdaf",FDAFFxNLMS(128,32,blocksize=32))]:
+        controller.setSecondary(wsec)
+        controller.setParams(0.1,1e-6)
+        e = runcontrol(controller,x,d)
+        powers[name] = 10*np.log10(np.mean(e[-5000:]**2) / np.mean(d[-5000:]**2))
+    assert powers["nlms"] < -8
+    assert abs(powers["fdaf"] - powers["nlms"]) < 3
+
+
+def test_fdaf_converges_as_nlms_on_beam():
+    # Closed loop on the beam with a sine disturbance: with the same mu, both controllers attenuate the
+    # error at about the same rate (the simulator calls update() before evalout() of each sample).
+    fs,controlstart = 416.0,5.0
+    perturbpos,referencepos,controlpos,errorpos = 30,75,60,95
+    beam = CantileverBeam(npoints=100,thickness=0.006,Tsampling=1/fs,damp=[0.01]*5)
+    wsecimpulse = beam.impulseresponse(controlpos,errorpos,1000)
+    wfbkimpulse = beam.impulseresponse(controlpos,referencepos,1000)
+    xh = 0.3 * np.sin(2*np.pi*12*np.arange(int(25*fs))/fs)
+    nwin,kstart = int(2*fs),int(controlstart*fs)
+    attenuation = {}
+    for name,controller in [("nlms",FIRFxNLMS(300,1000)),("fdaf",FDAFFxNLMS(300,1000,blocksize=64))]:
+        controller.setSecondary(wsecimpulse)
+        controller.setParams(0.001,1e-3)
+        simulator = ClosedLoopSimulator(beam,controller,FIR(wfbkimpulse),perturbpos,referencepos,controlpos,
+                                        errorpos,sparse=True)
+        err = simulator.run(xh,controlstart)['err']
+        attenuation[name] = 10*np.log10(np.mean(err[kstart-nwin:kstart]**2) / np.mean(err[-nwin:]**2))
+    assert attenuation["nlms"] > 20
+    assert attenuation["fdaf"] > 0.7 * attenuation["nlms"]
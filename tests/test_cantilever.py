@@ -0,0 +1,203 @@
+import numpy as np
+import pytest
+from scipy import linalg, signal
+
+from ActVibModules.CantileverBeam import CantileverBeam, CantileverBeamBatch, ModalCache
+
+
+def referencemodes(beam):
+    # Modal analysis of the original implementation: flexibility matrix assembled element by element,
+    # inverted, and general eigenproblem of the Cholesky-transformed stiffness matrix.
+    I = (beam.width * beam.thickness**3) / 12
+    beam_mass = beam.density * beam.width * beam.thickness * beam.length
+    M = np.eye(beam.npoints) * (beam_mass/beam.npoints)
+    M[0,0] = M[0,0]/2
+    A = np.zeros((beam.npoints,beam.npoints))
+    for r in range(beam.npoints):
+        for c in range(r+1):
+            k = beam.npoints-r
+            l = beam.npoints-c
+            A[r,c] = ((beam.deltax**3)/(6*beam.elasticmod*I)) * (3* k**2 * l - k**3)
+            A[c,r] = A[r,c]
+    K = linalg.inv(A)
+    L = linalg.cholesky(M)
+    Kt = linalg.inv(L.T) @ K @ linalg.inv(L)
+    ww,P = linalg.eig(Kt)
+    ww = np.real(ww)
+    sidxs = np.argsort(ww)
+    U = linalg.inv(L) @ P
+    vmod = np.zeros((beam.npoints,beam.nmodes))
+    freqsHz = np.zeros(beam.nmodes)
+    for k in range(beam.nmodes):
+        vmod[:,k] = np.real(U[::-1,sidxs[k]])
+        freqsHz[k] = np.sqrt(ww[sidxs[k]])/2/np.pi
+    return vmod,freqsHz
+
+
+@pytest.mark.parametrize("npoints",[10,30,60])
+def test_modes_match_reference(npoints):
+    beam = CantileverBeam(npoints=npoints)
+    vmod,freqsHz = beam.computeModesAndFreqs()
+    refvmod,reffreqsHz = referencemodes(beam)
+    np.testing.assert_allclose(freqsHz,reffreqsHz,rtol=1e-8)
+    refvmod = refvmod * np.sign(refvmod[-1,:])  # Sign convention of computeModesAndFreqs()
+    np.testing.assert_allclose(vmod,refvmod,rtol=0,atol=1e-6*np.abs(refvmod).max())
+
+
+@pytest.mark.parametrize("output",["accel","vel","disp","rotvel"])
+def test_statespace_matches_update(output):
+    beam = CantileverBeam(npoints=30)
+    inputs,outputs = [10,20],[5,29]
+    forces = np.random.default_rng(0).standard_normal((200,len(inputs)))
+    getoutput = {'accel': lambda: beam.a,'vel': lambda: beam.bufvel[:,0],'disp': lambda: beam.x,
+                 'rotvel': lambda: beam.rotvel}[output]
+    expected = np.zeros((forces.shape[0],len(outputs)))
+    for n in range(forces.shape[0]):
+        for pos,force in zip(inputs,forces[n]):
+            beam.setforce(pos,force)
+        beam.update()
+        expected[n] = getoutput()[outputs]
+    _,y,_ = signal.dlsim(CantileverBeam(npoints=30).to_statespace(inputs,outputs,output),forces)
+    np.testing.assert_allclose(y,expected,rtol=1e-9,atol=1e-12*np.abs(expected).max())
+
+
+@pytest.mark.parametrize("sparse",[False,True])
+def test_update_block_matches_update(sparse):
+    forces = np.random.default_rng(1).standard_normal(100)
+    inpos,outpos = 12,[0,7,25]
+    reference = CantileverBeam(npoints=30)
+    expected = [np.zeros((forces.shape[0],len(outpos))) for _ in range(4)]
+    for n,force in enumerate(forces):
+        reference.setforce(inpos,force)
+        reference.update()
+        for out,values in zip(expected,(reference.x,reference.bufvel[:,0],reference.a,reference.rotvel)):
+            out[n] = values[outpos]
+    beam = CantileverBeam(npoints=30)
+    if sparse:
+        beam.observe([20],forcepositions=[inpos])  # Output positions are not observed
+    blocks = [beam.update_block(forces[k:k+30],inpos,outpos) for k in range(0,forces.shape[0],30)]
+    for k,out in enumerate(expected):
+        result = np.concatenate([block[k] for block in blocks])
+        np.testing.assert_allclose(result,out,rtol=1e-9,atol=1e-9*np.abs(out).max())
+
+
+@pytest.mark.parametrize("forcepositions",[None,[12,20]])
+def test_sparse_update_matches_full(forcepositions):
+    forces = np.random.default_rng(2).standard_normal((300,2))
+    observed = [5,25]
+    full = CantileverBeam(npoints=30)
+    beam = CantileverBeam(npoints=30)
+    beam.observe(observed,forcepositions)
+    for force,nlforce in forces:
+        for b in (full,beam):
+            b.setforce(12,force)
+            b.setforcenl(20,0.1*nlforce)  # Depends on the displacement at a position not observed
+            b.update()
+        assert np.isfinite(beam.f).all()
+        for fullvalues,values in ((full.x,beam.x),(full.a,beam.a),(full.rotvel,beam.rotvel)):
+            np.testing.assert_allclose(values[observed],fullvalues[observed],rtol=1e-9,
+                                       atol=1e-9*np.abs(fullvalues).max())
+    np.testing.assert_allclose(beam.getfullfield()[0],full.x,rtol=1e-9,atol=1e-9*np.abs(full.x).max())
+
+
+def test_update_block_ignores_forces_outside_forcepositions():
+    forces = np.random.default_rng(3).standard_normal(60)
+    inpos,outpos = 12,[25]
+    reference = CantileverBeam(npoints=30)
+    reference.observe(outpos,forcepositions=[inpos])
+    reference.setforce(3,1.0)  # Ignored by update()
+    expected = np.zeros(forces.shape[0])
+    for n,force in enumerate(forces):
+        reference.setforce(inpos,force)
+        reference.update()
+        expected[n] = reference.a[outpos[0]]
+    beam = CantileverBeam(npoints=30)
+    beam.observe(outpos,forcepositions=[inpos])
+    beam.setforce(3,1.0)
+    result = beam.update_block(forces,inpos,outpos[0])[2]
+    np.testing.assert_allclose(result,expected,rtol=1e-9,atol=1e-9*np.abs(expected).max())
+
+
+def test_batch_matches_separate_beams():
+    damp = np.array([[0.002,0.002,0.001,0.001,0.001],[0.01,0.02,0.01,0.005,0.005],[0.05,0.01,0.02,0.02,0.01]])
+    forcescaler = np.array([1.0,2.0,0.5])
+    noisestd = np.array([0.0,1e-3,2e-3])
+    batch = CantileverBeamBatch(3,npoints=30,damp=damp,forcescaler=forcescaler,noisestd=noisestd)
+    beams = [CantileverBeam(npoints=30,damp=list(damp[k]),forcescaler=forcescaler[k],noisestd=noisestd[k])
+             for k in range(3)]
+    forces = np.random.default_rng(4).standard_normal((200,3))
+    for force in forces:
+        batch.setforce(10,force)
+        batch.setforcenl(20,0.1*force)
+        batch.update()
+        for k,beam in enumerate(beams):
+            beam.setforce(10,force[k])
+            beam.setforcenl(20,0.1*force[k])
+            beam.update()
+        for name in ('x','a','rotvel'):
+            expected = np.stack([getattr(beam,name) for beam in beams])
+            np.testing.assert_allclose(getattr(batch,name),expected,rtol=1e-9,atol=1e-9*np.abs(expected).max())
+        # One noise draw per beam, in the order of the beams:
+        np.random.seed(0)
+        expected = np.array([beam.getaccelms2(25) for beam in beams])
+        np.random.seed(0)
+        np.testing.assert_allclose(batch.getaccelms2(25),expected,rtol=1e-9,atol=1e-9*np.abs(expected).max())
+
+
+def test_modalcache_lru_and_stats():
+    cache = ModalCache(maxsize=2)
+    vmod,freqsHz = np.ones((4,2)),np.ones(2)
+    assert cache.get("a") is None
+    cache.put("a",vmod,freqsHz)
+    cache.put("b",2*vmod,2*freqsHz)
+    assert cache.get("a") is not None  # "a" becomes the most recently used
+    cache.put("c",3*vmod,3*freqsHz)  # Evicts "b"
+    assert cache.get("b") is None
+    np.testing.assert_array_equal(cache.get("c")[0],3*vmod)
+    assert cache.getstats() == {'hits': 2,'diskhits': 0,'misses': 2,'size': 2}
+    cache.clear()
+    assert cache.getstats()['size'] == 0
+
+
+def test_modalcache_disk_roundtrip(tmp_path):
+    key = CantileverBeam(npoints=30).modalkey()
+    vmod,freqsHz = CantileverBeam(npoints=30).computeModesAndFreqs()
+    ModalCache(cachedir=tmp_path).put(key,vmod,freqsHz)
+    cache = ModalCache(cachedir=tmp_path)  # New process/session: empty LRU
+    cachedvmod,cachedfreqsHz = cache.get(key)
+    np.testing.assert_array_equal(cachedvmod,vmod)
+    np.testing.assert_array_equal(cachedfreqsHz,freqsHz)
+    assert cache.getstats() == {'hits': 0,'diskhits': 1,'misses': 0,'size': 1}
+    cache.clear(disk=True)
+    assert cache.get(key) is None
+
+
+def test_modalcache_key_has_version():
+    beam = CantileverBeam(npoints=30)
+    key = beam.modalkey()
+    assert key[0] == CantileverBeam.modalversion
+    beam.modalversion = CantileverBeam.modalversion + 1  # Modes of another version are not reused
+    assert beam.modalkey() != key
+
+
+def test_modalcache_returns_copies():
+    CantileverBeam.modalcache.clear()
+    first = CantileverBeam(npoints=30)
+    expected = first.vmod.copy()
+    first.vmod[:] = 0
+    second = CantileverBeam(npoints=30)  # Cache hit
+    np.testing.assert_array_equal(second.vmod,expected)
+    second.vmod[:] = 1
+    np.testing.assert_array_equal(CantileverBeam(npoints=30).vmod,expected)
+
+
+def test_cached_modes_give_same_results():
+    CantileverBeam.modalcache.clear()
+    beams = [CantileverBeam(npoints=30),CantileverBeam(npoints=30)]  # Computed and cached modes
+    rng = np.random.default_rng(5)
+    for force in rng.standard_normal((1000,2)) * 10.0**rng.integers(-4,1,(1000,2)):
+        for beam in beams:
+            beam.setforce(12,force[0])
+            beam.setforce(20,force[1])
+            beam.update()
+        np.testing.assert_array_equal(beams[0].a,beams[1].a)
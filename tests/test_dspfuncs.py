@@ -0,0 +1,66 @@
+import numpy as np
+import pytest
+
+from ActVibModules.DSPFuncs import ARSmooth, ARSmoother, DCRemover
+
+
+def arsmoothloop(sig,coef):
+    # Sample-by-sample loop of the original ARSmooth.
+    last = 0
+    out = np.zeros(sig.shape)
+    for n in range(sig.shape[0]):
+        out[n] = coef*last + sig[n]*(1-coef)
+        last = out[n]
+    return out
+
+
+def dcremoverloop(x,alpha):
+    # Sample-by-sample loop of the original DCRemover.filter.
+    y = np.zeros(x.shape[0])
+    wn = 0
+    for k in range(x.shape[0]):
+        wn1 = wn
+        wn = x[k] + alpha * wn1
+        y[k] = wn - wn1
+    return y
+
+
+signal = 2.0 + np.random.default_rng(0).standard_normal(500)
+chunksizes = [1,7,0,100,0,392]  # Including empty chunks
+
+
+def chunked(processor,x,axis=0):
+    bounds = np.cumsum([0] + chunksizes)
+    return np.concatenate([processor.process(np.take(x,range(k0,k1),axis=axis))
+                           for k0,k1 in zip(bounds[:-1],bounds[1:])],axis=axis)
+
+
+def test_arsmooth_matches_loop():
+    np.testing.assert_array_equal(ARSmooth(signal,0.9),arsmoothloop(signal,0.9))
+    np.testing.assert_array_equal(chunked(ARSmoother(0.9),signal),arsmoothloop(signal,0.9))
+
+
+def test_dcremover_matches_loop():
+    np.testing.assert_array_equal(DCRemover(0.98).filter(signal),dcremoverloop(signal,0.98))
+    np.testing.assert_array_equal(chunked(DCRemover(0.98),signal),dcremoverloop(signal,0.98))
+
+
+@pytest.mark.parametrize("axis",[0,1])
+def test_2d_along_axis(axis):
+    channels = np.stack([signal,-3*signal[::-1]],axis=1-axis)
+    for k in range(2):
+        channel = np.take(channels,k,axis=1-axis)
+        np.testing.assert_array_equal(np.take(chunked(ARSmoother(0.9,axis=axis),channels,axis),k,axis=1-axis),
+                                      arsmoothloop(channel,0.9))
+        np.testing.assert_array_equal(np.take(chunked(DCRemover(0.98,axis=axis),channels,axis),k,axis=1-axis),
+                                      dcremoverloop(channel,0.98))
+
+
+def test_empty_chunk():
+    assert DCRemover().filter(np.array([])).shape == (0,)
+    assert DCRemover(axis=1).process(np.zeros((3,0))).shape == (3,0)
+    smoother = ARSmoother()
+    smoother.process(np.ones(10))
+    last = smoother.last
+    assert smoother.process(np.array([])).shape == (0,)
+    assert smoother.last == last
@@ -0,0 +1,44 @@
+import numpy as np
+
+from ActVibModules.Filters import FIR, DelayLine
+
+
+def test_filter_block_matches_filterstep():
+    rng = np.random.default_rng(0)
+    w = rng.standard_normal(100)
+    x = rng.standard_normal(500)
+    fir = FIR(w)
+    expected = np.array([fir.filterstep(xk) for xk in x])
+    fir.reset()
+    y = np.concatenate([fir.filter_block(x[k:k+37]) for k in range(0,x.shape[0],37)])
+    np.testing.assert_allclose(y,expected,rtol=1e-10,atol=1e-12)
+
+
+def test_filter_empty_chunk():
+    rng = np.random.default_rng(0)
+    fir = FIR(rng.standard_normal(8))
+    x = rng.standard_normal(20)
+    fir.filter(x[:10])
+    state = fir.x.copy()
+    assert fir.filter(np.array([])).shape == (0,)
+    assert fir.filter_block(np.zeros(0)).shape == (0,)
+    np.testing.assert_array_equal(fir.x,state)
+    np.testing.assert_allclose(fir.filter(x[10:]),np.convolve(x,fir.w)[10:20])
+
+
+def test_delayline_energy_after_amplitude_drop():
+    line = DelayLine(64,trackenergy=True)
+    x = np.concatenate((1e3*np.ones(500),1e-4*np.ones(300)))
+    for k,xk in enumerate(x):
+        line.push(xk)
+        exact = line.x @ line.x
+        assert line.energy >= 0
+        np.testing.assert_allclose(line.energy,exact,rtol=1e-6)
+
+
+def test_delayline_without_energy():
+    line = DelayLine(4)
+    for xk in [1.0,2.0,3.0]:
+        line.push(xk)
+    np.testing.assert_array_equal(line.x,[3.0,2.0,1.0,0.0])
+    assert line.energy == 0.0
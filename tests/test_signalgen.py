@@ -0,0 +1,74 @@
+import numpy as np
+import pytest
+
+from ActVibModules import SignalGen
+
+
+def sineloop(Npoints,freqHz,samplingT):
+    # Sample loop of the original sine() (which ignored Amplitude).
+    x = np.zeros(Npoints)
+    for k in range(Npoints):
+        x[k] = np.sin(2*np.pi*freqHz*k*samplingT)
+    return x
+
+
+def chirploop(seconds,samplingfreq,freq,ampl=1,deltai=10,deltaf=10,tinicio=10,tfim=None):
+    # Sample loop of the original chirp().
+    dt = 1/samplingfreq
+    tt = np.arange(0,seconds,dt)
+    out = np.zeros(tt.shape[0])
+    f = 0
+    integ = 0
+    cA = ampl/(freq**2)
+    if tfim is None:
+        tfim = seconds
+    for n,t in enumerate(tt):
+        if (t < tinicio) or (t > (tfim+deltaf)):
+            f = 0
+        elif t <= (tinicio+deltai):
+            f = freq * (t-tinicio) / deltai
+        elif (t >= tfim) and (t <= (tfim+deltaf)):
+            f = freq - freq * (t-tfim) / deltaf
+        integ = integ + 2*np.pi*f*dt
+        out[n] = ((f**2) * cA) * np.sin(integ)
+    return out
+
+
+def test_sine_matches_loop_and_applies_amplitude():
+    expected = sineloop(1000,12.0,1/416)
+    np.testing.assert_array_equal(SignalGen.sine(1000,12.0,1/416),expected)
+    np.testing.assert_array_equal(SignalGen.sine(1000,12.0,1/416,Amplitude=0.3),0.3*expected)
+
+
+@pytest.mark.parametrize("kwargs",[{},{'tfim': 30,'deltaf': 5},{'tinicio': 0,'deltai': 3}])
+def test_chirp_matches_loop(kwargs):
+    expected = chirploop(50,416,12.0,ampl=0.5,**kwargs)
+    result = SignalGen.chirp(50,416,12.0,ampl=0.5,**kwargs)
+    np.testing.assert_array_max_ulp(result,expected,maxulp=1)
+
+
+def concatenated(blocks):
+    return np.concatenate(list(blocks),axis=-1)
+
+
+def test_sine_blocks():
+    expected = SignalGen.sine(1000,12.0,1/416,Amplitude=0.3)
+    np.testing.assert_array_equal(concatenated(SignalGen.sineBlocks(64,12.0,1/416,Amplitude=0.3,Npoints=1000)),expected)
+
+
+def test_chirp_blocks():
+    expected = SignalGen.chirp(50,416,12.0,ampl=0.5,tfim=30,deltaf=5)
+    result = concatenated(SignalGen.chirpBlocks(300,416,12.0,ampl=0.5,tfim=30,deltaf=5,seconds=50))
+    assert result.shape == expected.shape
+    np.testing.assert_array_max_ulp(result,expected,maxulp=1)
+
+
+@pytest.mark.parametrize("nrealizations",[None,3])
+def test_filtered_noise_blocks(nrealizations):
+    np.random.seed(0)
+    expected = SignalGen.filteredNoise(1000,0.5,5.0,40.0,416.0,order=4,nrealizations=nrealizations)
+    np.random.seed(0)
+    result = concatenated(SignalGen.filteredNoiseBlocks(128,0.5,5.0,40.0,416.0,order=4,Npoints=1000,
+                                                        nrealizations=nrealizations))
+    assert result.shape == expected.shape
+    np.testing.assert_array_equal(result,expected)
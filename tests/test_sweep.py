@@ -0,0 +1,15 @@
+import numpy as np
+
+from ActVibModules.Sweep import ParameterSweep, runscenario, runseed
+
+scenario = {'maxtime': 6.0, 'controlstart': 2.0, 'window': 2.0, 'mem': 50, 'memsec': 200, 'mu': 0.01}
+
+
+def test_sweep_varying_memsec():
+    space = [{'memsec': 100},{'memsec': 300}]
+    results = ParameterSweep(scenario,space,seed=1,maxworkers=1).run()
+    assert not results['diverged'].any()
+    for run,params in enumerate(space):
+        expected = runscenario({**scenario,**params},runseed(1,run))
+        for name in ('attenuationdB','steadystatedB','convergencetime'):
+            np.testing.assert_allclose(results.loc[run,name],expected[name])
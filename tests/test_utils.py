@@ -0,0 +1,87 @@
+import numpy as np
+import pytest
+
+from ActVibModules.Adaptive import FIRFxNLMS
+from ActVibModules.CantileverBeam import CantileverBeam
+from ActVibModules.Filters import FIR
+from ActVibModules.Utils import ClosedLoopSimulator
+
+fs = 416.0
+perturbpos,referencepos,controlpos,errorpos = 10,22,16,28
+controlstart = 1.0
+
+
+def setup(noisestd=1e-3):
+    beam = CantileverBeam(npoints=30,Tsampling=1/fs,noisestd=noisestd)
+    wsecimpulse = beam.impulseresponse(controlpos,errorpos,200)
+    wfbkimpulse = beam.impulseresponse(controlpos,referencepos,200)
+    controller = FIRFxNLMS(100,200)
+    controller.setSecondary(wsecimpulse)
+    controller.setParams(0.01,1e-3)
+    return beam,controller,FIR(wfbkimpulse)
+
+
+def simulator(sparse=False,decimation=1):
+    beam,controller,feedbackfilter = setup()
+    return ClosedLoopSimulator(beam,controller,feedbackfilter,perturbpos,referencepos,controlpos,errorpos,
+                               log=ClosedLoopSimulator.signalnames,decimation=decimation,sparse=sparse)
+
+
+xh = 0.3 * np.sin(2*np.pi*12*np.arange(int(4*fs))/fs)
+
+
+def run(sim,blocks=None):
+    # Run with the noise seeded after building the simulator.
+    np.random.seed(0)
+    if blocks is None:
+        return sim.run(xh,controlstart)
+    return list(sim.runblocks(np.split(xh,blocks),controlstart))
+
+
+def test_run_matches_handwritten_loop():
+    # Loop of the examples, including the order of the noise draws of getaccelms2(), on the same objects.
+    sim = simulator()
+    cbeam,controller,feedbackfilter = sim.beam,sim.controller,sim.feedbackfilter
+    th = np.arange(xh.shape[0]) * cbeam.Ts
+    err = np.zeros(xh.shape[0])
+    yfbk = np.zeros(xh.shape[0])
+    np.random.seed(0)
+    for k in range(xh.shape[0]):
+        cbeam.setforce(perturbpos,xh[k])
+        cbeam.setforce(controlpos,-controller.y)
+        if th[k] >= controlstart:
+            controller.update(cbeam.getaccelms2(errorpos))
+        yfbk[k] = feedbackfilter.filterstep(-controller.y)
+        controller.evalout(cbeam.getaccelms2(referencepos) - yfbk[k])
+        err[k] = cbeam.getaccelms2(errorpos)
+        cbeam.update()
+    results = run(sim)  # Beam, controller and feedback filter are reset
+    assert np.array_equal(results['err'],err)
+    assert np.array_equal(results['fbk'],yfbk)
+    assert np.array_equal(results['t'],th)
+
+
+def test_runblocks_matches_run():
+    expected = run(simulator())
+    blocks = run(simulator(),[100,700,1200])
+    for name in ('t',) + ClosedLoopSimulator.signalnames:
+        assert np.array_equal(np.concatenate([block[name] for block in blocks]),expected[name])
+
+
+@pytest.mark.parametrize("decimation",[1,7,10])
+def test_decimation(decimation):
+    expected = run(simulator())
+    results = run(simulator(decimation=decimation))
+    nlogged = -(-xh.shape[0] // decimation)
+    for name in ('t',) + ClosedLoopSimulator.signalnames:
+        assert results[name].shape == (nlogged,)
+        assert np.array_equal(results[name],expected[name][::decimation])
+
+
+def test_sparse_matches_full():
+    expected = run(simulator())
+    sim = simulator(sparse=True)
+    results = run(sim)
+    assert sim.beam.observedpos is None  # Sparse-output mode only during the run
+    for name in ClosedLoopSimulator.signalnames:
+        np.testing.assert_allclose(results[name],expected[name],rtol=1e-9,atol=1e-9*np.abs(expected[name]).max())